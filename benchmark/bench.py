@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+"""This file is part of matrix2latex.
+
+matrix2latex is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+matrix2latex is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with matrix2latex. If not, see <http://www.gnu.org/licenses/>.
+"""
+# Benchmarks of the matrix2latex hot paths, time (best of a few runs) and peak memory (tracemalloc):
+#   python bench.py --save          # run and store the results as the baseline
+#   python bench.py                 # run and compare with the baseline, exit code 1 on a regression
+#                                   # and 2 if there is no baseline
+#   python bench.py -k numpy --max-cells 10000
+# Cases needing numpy or pandas are skipped if they are missing, memory is not measured without tracemalloc
+# (python 2, pypy).
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(os.path.expanduser(__file__)))
+sys.path.insert(0, os.path.join(SCRIPT_DIR, '..'))
+from matrix2latex import matrix2latex
+from matrix2latex.fixEngineeringNotation import fix, fixMany
+
+try:
+    clock = time.perf_counter
+except AttributeError:
+    clock = time.time
+
+SIZES = (10, 10**3, 10**4, 10**5, 10**6) # cells
+COLUMNS = 10
+
+def _rows(cells):
+    n = min(COLUMNS, cells)
+    return [[0.5*i + j*1e-7 for j in range(n)] for i in range(cells//n)]
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+def _pandas():
+    try:
+        import pandas
+    except ImportError:
+        return None
+    return pandas
+
+# Each case takes the number of cells and returns a function rendering them, or None to skip the case
+
+def case_list(cells):
+    matr = _rows(cells)
+    return lambda: matrix2latex(matr)
+
+def case_list_format(cells):
+    matr = _rows(cells)
+    return lambda: matrix2latex(matr, format='$%.3e$')
+
+def case_list_formatColumn(cells):
+    matr = _rows(cells)
+    formatColumn = ['$%.2f$', '%g', '${:.3e}$', '%s', '$%d$']*(COLUMNS//5)
+    return lambda: matrix2latex(matr, formatColumn=formatColumn[:len(matr[0])])
+
+def case_list_transpose(cells):
+    matr = _rows(cells)
+    return lambda: matrix2latex(matr, transpose=True)
+
+def case_list_headerRow(cells):
+    matr = _rows(cells)
+    n = len(matr[0])
+    headerRow = [['group %d' % (j//2) for j in range(n)], ['column %d' % j for j in range(n)]]
+    return lambda: matrix2latex(matr, headerRow=headerRow, headerColumn=['row %d' % i for i in range(len(matr))])
+
+def case_strings(cells):
+    matr = [['cell %d' % (i + j) for j in range(min(COLUMNS, cells))] for i in range(max(1, cells//COLUMNS))]
+    return lambda: matrix2latex(matr, format='%s')
+
+def case_iterator(cells):
+    matr = _rows(cells)
+    return lambda: matrix2latex(iter(matr))
+
+def case_file(cells):
+    matr = _rows(cells)
+    filename = os.path.join(tempfile.gettempdir(), 'matrix2latex_bench')
+    return lambda: matrix2latex(matr, filename)
+
+def case_numpy(cells):
+    np = _numpy()
+    if np is None:
+        return None
+    arr = np.array(_rows(cells))
+    return lambda: matrix2latex(arr)
+
+def case_numpy_transpose(cells):
+    np = _numpy()
+    if np is None:
+        return None
+    arr = np.array(_rows(cells))
+    return lambda: matrix2latex(arr, transpose=True)
+
+def case_pandas(cells):
+    pd = _pandas()
+    if pd is None:
+        return None
+    rows = _rows(cells)
+    df = pd.DataFrame(rows, columns=['c%d' % j for j in range(len(rows[0]))])
+    df['c0'] = df['c0'].astype(int)
+    return lambda: matrix2latex(df)
+
+def _fixCells(cells):
+    return ['%g' % (1.5*10**(i % 40 - 20)) for i in range(cells)] # half of them with an exponent
+
+def case_fix(cells):
+    cells = _fixCells(cells)
+    return lambda: [fix(s, table=True) for s in cells]
+
+def case_fixMany(cells):
+    cells = _fixCells(cells)
+    return lambda: fixMany(cells, table=True)
+
+def cases():
+    """Sorted list of (name, case function)"""
+    return sorted((name[len('case_'):], f) for name, f in globals().items() if name.startswith('case_'))
+
+def measure(function, repeat):
+    """The best time of repeat calls to function, and the peak memory of one call in bytes (None without tracemalloc)"""
+    best = None
+    for _ in range(repeat):
+        start = clock()
+        function()
+        elapsed = clock() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    if tracemalloc is None:
+        return best, None
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+def run(keyword=None, maxCells=max(SIZES), out=sys.stdout):
+    """Runs the cases (with keyword in their name) for each size up to maxCells,
+    returns a dictionary from 'case/cells' to dict(seconds, peak)"""
+    results = dict()
+    for name, case in cases():
+        if keyword is not None and keyword not in name:
+            continue
+        for cells in SIZES:
+            if cells > maxCells:
+                continue
+            function = case(cells)
+            if function is None:
+                continue
+            seconds, peak = measure(function, repeat=max(1, min(20, 10**5//cells)))
+            key = '%s/%d' % (name, cells)
+            results[key] = dict(seconds=seconds, peak=peak)
+            out.write('%-32s %12.6f s %12s B\n' % (key, seconds, '-' if peak is None else peak))
+            out.flush()
+    return results
+
+def compare(results, baseline, threshold, minSeconds=1e-3):
+    """
+    input: results and baseline from run, allowed relative increase threshold (0.25 is 25%)
+    output: list of messages, one per case that is slower or uses more memory than the baseline allows
+    Times below minSeconds are too noisy to compare.
+    """
+    regressions = list()
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        new, old = results[key], baseline[key]
+        if max(new['seconds'], old['seconds']) >= minSeconds and new['seconds'] > old['seconds']*(1 + threshold):
+            regressions.append('%s: %.6f s, baseline %.6f s' % (key, new['seconds'], old['seconds']))
+        if new['peak'] is None or old['peak'] is None: # measured without tracemalloc
+            continue
+        if new['peak'] > old['peak']*(1 + threshold) + 1024:
+            regressions.append('%s: peak %d B, baseline %d B' % (key, new['peak'], old['peak']))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of matrix2latex, compared with a stored baseline.')
+    parser.add_argument('-k', '--keyword', help='only run the cases with this in their name')
+    parser.add_argument('--max-cells', type=int, default=max(SIZES), help='largest table size to run')
+    parser.add_argument('--baseline', default=os.path.join(SCRIPT_DIR, 'baseline.json'))
+    parser.add_argument('--save', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed relative increase of time and memory, default 0.25')
+    args = parser.parse_args(argv)
+
+    if not args.save and not os.path.exists(args.baseline): # fail before running, not after
+        sys.stderr.write('ERROR no baseline %s to compare with, run with --save first\n' % args.baseline)
+        return 2
+    results = run(args.keyword, args.max_cells)
+    if args.save:
+        baseline = dict()
+        if os.path.exists(args.baseline):   # keep the cases that were not run
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print('baseline saved to %s' % args.baseline)
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for message in regressions:
+        print('REGRESSION ' + message)
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
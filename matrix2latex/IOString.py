@@ -1,24 +1,33 @@
 # I needed a string object that had the write function
 
-class IOString:                  # todo subclass str?
+class IOString(object):          # todo subclass str?
     # For a file like object, writes to the file while keeping
     # a local buffer.
+    # The buffer is a list of chunks that is only joined when the string is asked for,
+    # appending to a str attribute (self.s += s) is quadratic for large tables.
     def __init__(self, fileObject=None):
         self.f = fileObject
-        self.s = ""
-        
+        self.chunks = []
+
     def write(self, s):
         try:
             self.f.write(s)
         except AttributeError:
             pass
-        self.s += s
+        self.chunks.append(s)
 
     def __str__(self):
-        return self.s
+        s = ''.join(self.chunks)
+        self.chunks = [s]           # no need to join again on the next call
+        return s
+
+    @property
+    def s(self):
+        # backwards compatibility, the buffer used to be a str called s
+        return self.__str__()
 
     def close(self):
         try:
             self.f.close()
         except AttributeError:
-            pass        
+            pass
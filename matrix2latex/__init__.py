@@ -14,10 +14,10 @@ You should have received a copy of the GNU General Public License
 along with matrix2latex. If not, see <http://www.gnu.org/licenses/>.
 """
 
-__all__ = ['matrix2latex']
+__all__ = ['matrix2latex', 'iter_latex', 'render_many', 'Renderer', 'RenderCache', 'DiskCache', 'Profile', 'metrics']
 
 try:
-    from matrix2latex import matrix2latex
+    from matrix2latex import matrix2latex, iter_latex, render_many, Renderer, RenderCache, DiskCache, Profile, metrics
 except ImportError:
     # Really ugly hack to please python3 import mechanisms
     import sys, os
@@ -25,5 +25,12 @@ except ImportError:
 
     sys.path.insert(0, SCRIPT_DIR)
     from matrix2latex import matrix2latex
+    iter_latex = matrix2latex.iter_latex
+    render_many = matrix2latex.render_many
+    Renderer = matrix2latex.Renderer
+    RenderCache = matrix2latex.RenderCache
+    DiskCache = matrix2latex.DiskCache
+    Profile = matrix2latex.Profile
+    metrics = matrix2latex.metrics
     matrix2latex = matrix2latex.matrix2latex
     del sys.path[0]             # NOTE: ensure that matrix2latex does not change sys.path
@@ -0,0 +1,117 @@
+"""This file is part of matrix2latex.
+
+matrix2latex is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+matrix2latex is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with matrix2latex. If not, see <http://www.gnu.org/licenses/>.
+"""
+# Command line interface, reads a csv/tsv file (or stdin) and writes the LaTeX table to stdout:
+#   python -m matrix2latex data.csv --header --format '$%.2f$' --caption 'Results' > table.tex
+# The rows are read, formatted and written one at a time, so the memory use does not depend on the size of the input.
+import sys
+import csv
+import argparse
+
+from matrix2latex import iter_latex
+
+def parseNumber(field):
+    """
+    input: a csv field
+    output: the field as int or float if possible, None if empty, otherwise the field itself
+    """
+    if field == '':
+        return None
+    try:
+        return int(field)
+    except ValueError:
+        pass
+    try:
+        return float(field)
+    except ValueError:
+        return field
+
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m matrix2latex',
+                                     description='Converts a csv or tsv file to a LaTeX table.')
+    parser.add_argument('input', nargs='?', default='-',
+                        help='csv/tsv file, default (or -) reads from stdin')
+    parser.add_argument('-d', '--delimiter', default=None,
+                        help="field delimiter, default is tab for .tsv files and ',' otherwise")
+    parser.add_argument('-t', '--tsv', action='store_const', const='\t', dest='delimiter',
+                        help='tab separated input')
+    parser.add_argument('-e', '--environment', action='append', dest='environments', default=[],
+                        help='environment, repeat for more, default is table, center and tabular')
+    parser.add_argument('--no-environment', action='store_true',
+                        help='do not add any environments')
+    parser.add_argument('-f', '--format', help="format for all elements, e.g. '$%%.2f$'")
+    parser.add_argument('-F', '--format-column', action='append', dest='formatColumn',
+                        help='format of the next column, repeat for each column')
+    parser.add_argument('-a', '--alignment', help="alignment, e.g. 'c' or 'lrr'")
+    parser.add_argument('-H', '--header', action='store_true',
+                        help='the first line of the input is the header row')
+    parser.add_argument('-r', '--header-row', dest='headerRow',
+                        help="comma separated labels of the columns, e.g. 'a,b,c'")
+    parser.add_argument('-c', '--caption')
+    parser.add_argument('-l', '--label')
+    parser.add_argument('-n', '--columns', type=int,
+                        help='number of columns, default is the length of the first row')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parseArguments(argv)
+
+    keywords = dict()
+    if args.format is not None:
+        keywords['format'] = args.format
+    if args.formatColumn is not None:
+        keywords['formatColumn'] = args.formatColumn
+    for key in ('alignment', 'caption', 'label', 'columns'):
+        value = getattr(args, key)
+        if value is not None:
+            keywords[key] = value
+    if args.no_environment:
+        keywords['environments'] = None
+
+    delimiter = args.delimiter
+    if delimiter is None:
+        delimiter = '\t' if args.input.endswith('.tsv') else ','
+    if args.input == '-':
+        f = sys.stdin
+    else:
+        f = open(args.input)
+    try:
+        reader = csv.reader(f, delimiter=delimiter)
+        if args.header:
+            try:
+                keywords['headerRow'] = next(reader)
+            except StopIteration: # empty input
+                pass
+        if args.headerRow is not None:
+            keywords['headerRow'] = args.headerRow.split(',')
+        rows = ([parseNumber(field) for field in row] for row in reader)
+
+        try:
+            for chunk in iter_latex(rows, *args.environments, **keywords):
+                sys.stdout.write(chunk)
+        except (ValueError, csv.Error) as e: # bad keyword, a row that is too long or bad csv
+            sys.stderr.write('matrix2latex: %s\n' % e)
+            return 1
+        except AssertionError as e: # bad option value (see error.py), a usage error as for argparse
+            sys.stderr.write('matrix2latex: %s\n' % e)
+            return 2
+        sys.stdout.write('\n')
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""This file is part of matrix2latex.
+
+matrix2latex is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+matrix2latex is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with matrix2latex. If not, see <http://www.gnu.org/licenses/>.
+"""
+# asyncio variant of render.matrix2image, python >= 3.5 only (kept out of render.py for python 2)
+import os
+import shutil
+import asyncio
+import tempfile
+import functools
+import subprocess
+import weakref
+
+from .matrix2latex import matrix2latex
+from . import metrics
+from .profiling import clock
+from .render import (Rendered, _latex_template, _latex_preamble, _latex_documentclass, _format, _badFormat,
+                     _ramDir, _cacheKeyword, _cachedImage, _storeOutputs, _texCommand, _checkOutput)
+
+max_concurrency = os.cpu_count() or 1 # size of the default semaphore
+_semaphores = weakref.WeakKeyDictionary() # event loop: default semaphore
+
+def _defaultSemaphore():
+    loop = asyncio.get_event_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(max_concurrency)
+    return _semaphores[loop]
+
+async def _kill(proc):
+    if proc.returncode is None:
+        try:
+            proc.kill()
+        except ProcessLookupError: # exited in the meantime
+            pass
+    await proc.wait()
+
+async def _run(cmd, cwd, timeout, withFormat=False):
+    # like subprocess.check_call, the process is killed after timeout seconds or when the task is cancelled
+    # timed and counted in the metrics like render._tex, also withFormat
+    start = clock()
+    observe = True
+    try:
+        proc = await asyncio.create_subprocess_exec(*cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                                    stdin=subprocess.DEVNULL)
+        try:
+            output, _ = await asyncio.wait_for(proc.communicate(), timeout)
+        except asyncio.TimeoutError:
+            await _kill(proc)
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        except BaseException: # cancelled, tex must not outlive the task
+            await _kill(proc)
+            raise
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd, output)
+    except subprocess.CalledProcessError:
+        if withFormat:
+            observe = False
+            metrics.formatFallbacks.inc()
+        else:
+            metrics.compileFailures.inc()
+        raise
+    except (OSError, subprocess.SubprocessError):
+        metrics.compileFailures.inc()
+        raise
+    finally:
+        if observe:
+            metrics.compileSeconds.observe(clock() - start)
+
+async def matrix2image_async(matr, filename=None, *args, **kwargs):
+    r'''
+    Coroutine version of render.matrix2image, for compiling many tables at once from an event loop::
+
+        results = await asyncio.gather(*[matrix2image_async(m, name, timeout=30) for m, name in tables])
+
+    Each call compiles in its own temporary directory, the table is formatted in a thread and
+    tex runs with ``asyncio.create_subprocess_exec``, its output is kept in the CalledProcessError
+    instead of being printed. Takes the keywords of matrix2image except ``working_dir``, and:
+
+    :key semaphore:
+        An asyncio.Semaphore limiting the number of tex processes,
+        by default one per event loop allowing ``asyncrender.max_concurrency`` (the number of cpus).
+    :key timeout=None:
+        Seconds before a tex process is killed.
+    :key in_memory=False:
+        As for matrix2image, the output is returned as bytes and the document compiled in ``/dev/shm`` if it exists.
+    :returns working_dir, latex:
+        As for matrix2image.
+
+    :raises IOError: if the expected output file was not created.
+    :raises subprocess.CalledProcessError: if the call to tex indicates a failure.
+    :raises subprocess.TimeoutExpired: if tex was killed after timeout seconds.
+    :raises ValueError: if working_dir is given.
+    '''
+    if filename is None:
+        filename = 'rendered'
+    if filename.endswith(('.pdf', '.tex', '.png')):
+        filename = filename[:-4]
+
+    if 'working_dir' in kwargs:
+        raise ValueError('Error: working_dir is not supported, each call uses its own temporary directory')
+    latex_template = kwargs.pop('latex_template', _latex_template)
+    latex_preamble = kwargs.pop('latex_preamble', _latex_preamble)
+    latex_documentclass = kwargs.pop('latex_documentclass', _latex_documentclass)
+    tex = kwargs.pop('tex', 'pdflatex')
+    tex_options = kwargs.pop('tex_options', ['-interaction=nonstopmode', '-shell-escape'])
+    output_format = kwargs.pop('output_format', '.pdf')
+    clean_latex = kwargs.pop('clean_latex', True)
+    format_dir = kwargs.pop('format_dir', None)
+    in_memory = kwargs.pop('in_memory', False)
+    semaphore = kwargs.pop('semaphore', None)
+    timeout = kwargs.pop('timeout', None)
+    cache = _cacheKeyword(kwargs)   # also passed on to matrix2latex
+    if semaphore is None:
+        semaphore = _defaultSemaphore()
+
+    loop = asyncio.get_event_loop()
+    output_filename_final = filename + output_format
+    table = await loop.run_in_executor(None, functools.partial(matrix2latex, matr, None, *args, **kwargs))
+    latex = latex_template % (latex_documentclass, latex_preamble, table)
+
+    key, cached = _cachedImage(cache, latex, tex, tex_options, output_format, output_filename_final, in_memory)
+    if cached is not None:
+        return cached
+
+    working_dir = tempfile.mkdtemp(prefix='matrix2image', dir=_ramDir() if in_memory else None)
+    outputs = dict()
+    try:
+        tex_filename = os.path.basename(filename) + '.tex'
+        with open(os.path.join(working_dir, tex_filename), 'w') as f:
+            f.write(latex)
+
+        if tex is not None and tex != '':
+            cmd = _texCommand(tex, tex_options, tex_filename)
+            async with semaphore:
+                fmt = None
+                if format_dir is not None:
+                    fmt = await loop.run_in_executor(None, _format, format_dir, tex,
+                                                     latex_documentclass, latex_preamble)
+                if fmt is None:
+                    await _run(cmd, working_dir, timeout)
+                else:
+                    try:
+                        await _run(_texCommand(tex, tex_options, tex_filename, fmt), working_dir, timeout,
+                                   withFormat=True)
+                    except subprocess.CalledProcessError:
+                        await _run(cmd, working_dir, timeout)
+                        _badFormat(fmt)
+
+            output_filename_tmp = os.path.join(working_dir, os.path.basename(filename) + output_format)
+            _checkOutput(output_filename_tmp, cmd)
+            outputs = _storeOutputs(output_filename_tmp, output_filename_final, output_format, in_memory, cache, key)
+    finally:
+        if clean_latex:
+            shutil.rmtree(working_dir, ignore_errors=True)
+    if clean_latex:
+        working_dir = None
+    return Rendered(working_dir, latex, **outputs)
@@ -0,0 +1,180 @@
+"""This file is part of matrix2latex.
+
+matrix2latex is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+matrix2latex is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with matrix2latex. If not, see <http://www.gnu.org/licenses/>.
+"""
+# In-process cache of rendered tables, keyed by a hash of the matrix and the options,
+# see the cache keyword of matrix2latex.
+import hashlib
+import marshal
+import threading
+from collections import OrderedDict
+
+from .vectorize import asNumericArray
+
+try:
+    _plain = frozenset([type(None), bool, int, float, str, long, unicode]) # python 2
+except NameError:
+    _plain = frozenset([type(None), bool, int, float, str])
+
+try:
+    _hash = hashlib.blake2b     # python >= 3.6
+except AttributeError:
+    _hash = hashlib.sha1
+
+def isPlain(obj):
+    """
+    input: anything
+    output: True if obj is None, a bool, a number, a string or a (nested) list or tuple of those,
+    repr(obj) and marshal.dumps(obj) are then exact descriptions of obj
+    """
+    if type(obj) in _plain:
+        return True
+    if type(obj) is list or type(obj) is tuple:
+        for e in obj:
+            if type(e) not in _plain and not isPlain(e):
+                return False
+        return True
+    return False
+
+def _hashArray(h, arr):
+    # the raw buffer, no copy unless arr is neither C nor Fortran contiguous
+    h.update(repr((arr.dtype.str, arr.shape)).encode('utf-8'))
+    if arr.flags.c_contiguous:
+        h.update(arr)
+    elif arr.flags.f_contiguous:
+        h.update(b'F')
+        h.update(arr.T)
+    else:
+        h.update(arr.copy())
+
+def _hashRows(h, matr, blockSize=1024):
+    # marshal of the rows, False if a row is not plain (see isPlain).
+    # Only plain rows are marshalled, marshal also accepts e.g. numpy scalars but stores them as bytes.
+    for row in matr:
+        if type(row) is not list and type(row) is not tuple or not _plain.issuperset(map(type, row)):
+            if not isPlain(row):
+                return False
+    for start in range(0, len(matr), blockSize):
+        h.update(marshal.dumps(matr[start:start + blockSize], 2)) # version 2 has no references between objects
+    return True
+
+def renderKey(matr, filename, environments, keywords):
+    """
+    input: the arguments of matrix2latex
+    output: hex digest identifying the output of matrix2latex, None if it can not be computed
+    Numeric numpy arrays are hashed over their buffer, lists (or tuples) of rows through marshal.
+    Returns None for other input (DataFrames, iterators, arrays of objects, ...)
+    and for keywords that are not plain (see isPlain).
+    """
+    h = _hash()
+    options = sorted((key, value) for key, value in keywords.items()
+                     if key not in ('workers', 'chunkSize', 'ifChanged', 'profile')) # same output with or without workers
+    options = (filename, tuple(environments), options)
+    if not isPlain(options):
+        return None
+    h.update(repr(options).encode('utf-8'))
+
+    array = asNumericArray(matr)
+    if array is not None and type(matr).__module__.startswith('numpy'): # not pandas, the labels are part of the table
+        _hashArray(h, array)
+    elif type(matr) is list or type(matr) is tuple:
+        if not _hashRows(h, matr):
+            return None
+    else:
+        return None
+    return h.hexdigest()
+
+class RenderCache(object):
+    r'''
+    Least recently used cache of rendered tables, for rendering the same matrices with the same options again::
+
+        cache = RenderCache(maxEntries=256, maxBytes=2**26)
+        t = matrix2latex(m, cache=cache, format="$%.2f$")
+
+    The key is a hash of the matrix content and all the arguments (see renderKey), matrices that can
+    not be hashed are rendered as usual without using the cache. With a filename the file is written also
+    when the table is found in the cache.
+
+    :param int maxEntries: The maximum number of tables, None for no limit.
+    :param int maxBytes: The maximum total length of the cached tables, None for no limit.
+    '''
+    def __init__(self, maxEntries=128, maxBytes=None):
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.entries = OrderedDict()    # key: table, least recently used first
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getstate__(self):         # locks can not be pickled
+        state = dict(self.__dict__)
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """The table for key (see renderKey) or None, counted as a hit or a miss"""
+        with self.lock:
+            try:
+                table = self.entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self.entries[key] = table   # most recently used
+            self.hits += 1
+            return table
+
+    def put(self, key, table):
+        """Stores table for key, evicting the least recently used tables to stay within the limits"""
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= len(self.entries.pop(key))
+            if self.maxBytes is not None and len(table) > self.maxBytes:
+                return                  # would evict everything else
+            self.entries[key] = table
+            self.bytes += len(table)
+            while ((self.maxEntries is not None and len(self.entries) > self.maxEntries) or
+                   (self.maxBytes is not None and self.bytes > self.maxBytes)):
+                _, old = self.entries.popitem(last=False)
+                self.bytes -= len(old)
+
+    # bytes (see render.matrix2image) are stored like tables, as in DiskCache
+    getBytes = get
+    putBytes = put
+
+    def invalidate(self, matr, filename=None, *environments, **keywords):
+        """Removes the table for these matrix2latex arguments, returns True if it was cached"""
+        key = renderKey(matr, filename, environments, keywords)
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= len(self.entries.pop(key))
+                return True
+            return False
+
+    def clear(self):
+        """Removes all tables, the hit and miss counters are kept"""
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """Dictionary with the number of hits, misses, tables and their total length (bytes)"""
+        return dict(hits=self.hits, misses=self.misses, entries=len(self.entries), bytes=self.bytes)
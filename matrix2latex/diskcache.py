@@ -0,0 +1,129 @@
+"""This file is part of matrix2latex.
+
+matrix2latex is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+matrix2latex is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with matrix2latex. If not, see <http://www.gnu.org/licenses/>.
+"""
+# Cache of rendered tables and compiled images in a directory, shared by all processes using it,
+# see the cache keyword of matrix2latex and render.matrix2image.
+import os
+
+from .files import writeAtomic, FileLock
+
+def _makedirs(directory):
+    try:
+        os.makedirs(directory)
+    except OSError:             # exists (python 2 has no exist_ok)
+        if not os.path.isdir(directory):
+            raise
+
+class DiskCache(object):
+    r'''
+    Cache of rendered tables and compiled images in a directory,
+    for repeated builds and for many processes (e.g. ``make -j``) rendering the same tables::
+
+        cache = DiskCache('.matrix2latex-cache', maxBytes=2**30)
+        matrix2latex(m, 'table', cache=cache)
+        matrix2image(m, 'table', cache=cache)
+
+    Can be used wherever a RenderCache is accepted, the entries are keyed the same way (see cache.renderKey).
+    Each entry is a file written atomically, a lock file serializes writers and the eviction
+    of the least recently used entries (by modification time, updated on each hit) while readers share it.
+
+    :param str directory: The cache directory, created if missing.
+    :param int maxBytes: The maximum total size of the entries, None for no limit.
+    '''
+    def __init__(self, directory, maxBytes=None):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.hits = 0               # in this process
+        self.misses = 0
+        _makedirs(directory)
+        self.lockFile = os.path.join(directory, 'lock')
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        """The table for key or None, counted as a hit or a miss"""
+        data = self.getBytes(key)
+        if data is None:
+            return None
+        return data.decode('utf-8')
+
+    def put(self, key, table):
+        """Stores table for key"""
+        self.putBytes(key, table.encode('utf-8'))
+
+    def getBytes(self, key):
+        """The bytes stored for key or None, counted as a hit or a miss"""
+        path = self._path(key)
+        with FileLock(self.lockFile, exclusive=False):
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                os.utime(path, None) # most recently used
+            except (IOError, OSError): # missing or evicted
+                self.misses += 1
+                return None
+        self.hits += 1
+        return data
+
+    def putBytes(self, key, data):
+        """Stores data for key, evicting the least recently used entries to stay within maxBytes"""
+        path = self._path(key)
+        _makedirs(os.path.dirname(path))
+        with FileLock(self.lockFile):
+            writeAtomic(path, data)
+            if self.maxBytes is not None:
+                self._evict()
+
+    def _entries(self):
+        # (modification time, size, path) of each entry
+        entries = list()
+        for sub in os.listdir(self.directory):
+            subdir = os.path.join(self.directory, sub)
+            if len(sub) != 2 or not os.path.isdir(subdir):
+                continue
+            for name in os.listdir(subdir):
+                if name.startswith('.'): # being written
+                    continue
+                path = os.path.join(subdir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _evict(self):
+        # called with the lock held
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        """Removes all entries"""
+        with FileLock(self.lockFile):
+            for _, _, path in self._entries():
+                os.remove(path)
+
+    def stats(self):
+        """Dictionary with the number of hits and misses (in this process), entries and their total size in bytes"""
+        with FileLock(self.lockFile, exclusive=False):
+            entries = self._entries()
+        return dict(hits=self.hits, misses=self.misses, entries=len(entries),
+                    bytes=sum(size for _, size, _ in entries))
@@ -8,6 +8,8 @@ def assertStr(value, key):
     
 def assertKeyFormat(value):
     assertStr(value, "format")
+    if "%" not in value and "{" in value:
+        return                  # str.format syntax, e.g. ${:.2f}$
     assert r"%" in value, \
            "expected a format str, got %s" % value
     assert value.count("%") == 1,\
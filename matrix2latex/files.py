@@ -0,0 +1,142 @@
+"""This file is part of matrix2latex.
+
+matrix2latex is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+matrix2latex is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with matrix2latex. If not, see <http://www.gnu.org/licenses/>.
+"""
+# Atomic file writes and file locks, for files shared between processes (see diskcache.py),
+# and writes that leave unchanged files untouched (see the ifChanged keyword of matrix2latex).
+import os
+import hashlib
+import binascii
+try:
+    import fcntl
+except ImportError:
+    fcntl = None                # windows, no locking
+
+try:
+    _replace = os.replace       # python >= 3.3, atomic also on windows
+except AttributeError:
+    _replace = os.rename
+
+def _tmpFilename(filename):
+    # unique name next to filename, hidden (see DiskCache._entries)
+    filename = os.path.abspath(filename)
+    return os.path.join(os.path.dirname(filename), '.%s.%d.%s.tmp' % (os.path.basename(filename), os.getpid(),
+                                                                     binascii.hexlify(os.urandom(4)).decode()))
+
+def _openTmp(tmp, mode):
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666) # unlike tempfile.mkstemp, respects the umask
+    return os.fdopen(fd, mode)
+
+def writeAtomic(filename, data):
+    """
+    input: filename, str or bytes data
+    Writes data to a temporary file next to filename and renames it to filename,
+    other processes see either the old or the new file, never a partial one.
+    """
+    tmp = _tmpFilename(filename)
+    f = _openTmp(tmp, 'wb' if isinstance(data, bytes) else 'w')
+    try:
+        with f:
+            f.write(data)
+        _replace(tmp, filename)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+def _digest(filename, blockSize=2**16):
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(blockSize), b''):
+            h.update(block)
+    return h.digest()
+
+def sameContent(a, b):
+    """
+    input: two filenames
+    output: True if both files exist and have the same content (same size and hash)
+    """
+    try:
+        if os.path.getsize(a) != os.path.getsize(b):
+            return False
+        return _digest(a) == _digest(b)
+    except OSError:             # missing
+        return False
+
+class AtomicFile(object):
+    """File object for writing filename through a temporary file next to it:
+
+        f = AtomicFile('table.tex')
+        f.write(...)
+        f.close()               # f.updated is False if table.tex already had this content
+
+    close() renames the temporary file to filename only if the content changed (always with
+    ifChanged=False), so an unchanged file keeps its modification time, and filename is never
+    seen partially written.
+    discard() removes the temporary file and leaves filename as it was, e.g. if rendering fails.
+    """
+    def __init__(self, filename, ifChanged=True):
+        self.filename = filename
+        self.ifChanged = ifChanged
+        self.tmp = _tmpFilename(filename)
+        self.f = _openTmp(self.tmp, 'w')
+        self.updated = None
+
+    def write(self, s):
+        self.f.write(s)
+
+    def close(self):
+        if self.f is None:
+            return
+        self.f.close()
+        self.f = None
+        try:
+            self.updated = not self.ifChanged or not sameContent(self.tmp, self.filename)
+            if self.updated:
+                _replace(self.tmp, self.filename)
+        finally:
+            if os.path.exists(self.tmp):
+                os.remove(self.tmp)
+
+    def discard(self):
+        if self.f is None:
+            return
+        self.f.close()
+        self.f = None
+        os.remove(self.tmp)
+
+class FileLock(object):
+    """Lock shared between processes, held while in a with statement:
+
+        with FileLock('cache/lock'):
+            ...
+
+    Several processes can hold a shared lock (exclusive=False) at the same time.
+    Does nothing if fcntl is missing (windows).
+    """
+    def __init__(self, filename, exclusive=True):
+        self.filename = filename
+        self.exclusive = exclusive
+        self.f = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.f = open(self.filename, 'a')
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH)
+        return self
+
+    def __exit__(self, *args):
+        if self.f is not None:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+            self.f.close()
+            self.f = None
@@ -16,23 +16,46 @@ along with matrix2latex. If not, see <http://www.gnu.org/licenses/>.
 
 import re
 
+_exponent = re.compile(r'e([-+]\d\d)')
+# lookup tables from the two digit exponent, e.g. '-08', to the replacement
+_replace = dict()
+_replaceTable = dict()
+for _sign in '-+':
+    for _i in range(100):
+        _number = '%s%02d' % (_sign, _i)
+        _replace[_number] = '\\e{%(#)3d}' % {'#': int(_number)}
+        _replaceTable[_number] = '\\e{%(#)+03d}' % {'#': int(_number)}
+del _sign, _i, _number
+
+def _sub(match):
+    return _replace[match.group(1)]
+
+def _subTable(match):
+    return _replaceTable[match.group(1)]
+
 def fix(s, table=False):
-    """
+    r"""
     input: (string) s
     output: (string) s
     takes any number in s and replaces the format
     '8e-08' with '8\e{-08}'
     """
-    i = re.search('e[-+]\d\d', s)
-    while i != None:
-        before = s[0:i.start()]
-        number = s[i.start()+1:i.start()+4]
-        after = s[i.end():]
-        if table:
-            num = "%(#)+03d" % {'#': int(number)}
-        else:
-            num = "%(#)3d" % {'#': int(number)}
-
-        s = '%s\\e{%s}%s' % (before, num, after)
-        i = re.search('e[-+]\d\d', s)
-    return s
+    if 'e' not in s:
+        return s
+    if table:
+        return _exponent.sub(_subTable, s)
+    return _exponent.sub(_sub, s)
+
+def fixMany(cells, table=False, sep='\n'):
+    """
+    input: list (or array) of strings cells
+    output: list of strings
+    same as [fix(s, table) for s in cells], but with a single pass over all the cells.
+    """
+    cells = list(cells)
+    joined = sep.join(cells)
+    if 'e' not in joined:
+        return cells
+    if joined.count(sep) != len(cells) - 1: # sep found in a cell, can't split
+        return [fix(s, table) for s in cells]
+    return fix(joined, table).split(sep)
@@ -0,0 +1,221 @@
+"""This file is part of matrix2latex.
+
+matrix2latex is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+matrix2latex is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with matrix2latex. If not, see <http://www.gnu.org/licenses/>.
+"""
+# Per-column format plan, each format string is parsed once per call to matrix2latex
+# and turned into a function that formats a single element.
+import re
+import math
+
+from .fixEngineeringNotation import fix, fixMany
+
+def isnan(e):
+    try:
+        return math.isnan(e)
+    except (TypeError, AttributeError):
+        return e == float("nan")
+
+inf = float('inf')
+
+# printf conversion, e.g. %g, %-8.2f or %s
+_printf = re.compile(r'%[-#0 +]*(?:\*|\d+)?(?:\.(?:\*|\d+))?[hlL]?([a-zA-Z%])')
+# str.format replacement field, e.g. {}, {0}, {:.2f} or {!r}, but not {%s}
+_strformat = re.compile(r'\{\d*(?:![rsa])?(?::([^{}]*))?\}')
+
+def isStrFormat(fmt):
+    # '${:.2f}$' is a str.format format, '$%.2f$' and '\textbf{%s}' are not
+    return _printf.search(fmt) is None and _strformat.search(fmt) is not None
+
+class NotNumeric(Exception):
+    # raised by NumberFormat for an element that can't be converted to float
+    pass
+
+class MissingFormat(object):
+    """Column without a format (formatColumn too short), every element is {-}"""
+    numeric = False
+    strformat = False
+    render = None
+    needsFix = False
+
+    def __call__(self, e):
+        return "{-}"
+
+class StringFormat(object):
+    """Formats elements as they are, used for formats containing '%s'
+    and for str.format fields without a float presentation type.
+    None and NaN gives {-}, +-inf gives $\\pm\\infty$."""
+    numeric = False
+    fix = staticmethod(fix)     # attributes, replaced when profiling (see profiling.Profile.timedPlan)
+    fixMany = staticmethod(fixMany)
+
+    def __init__(self, fmt):
+        self.fmt = fmt
+        self.strformat = isStrFormat(fmt)
+        if self.strformat:
+            self.render = fmt.format
+            self.needsFix = True
+        else:
+            self.render = fmt.__mod__
+            # integer and %f conversions never gives e-notation, skip fix unless the literal text has an 'e'
+            conversions = _printf.findall(fmt)
+            literal = _printf.sub('', fmt)
+            self.needsFix = 'e' in literal or len([c for c in conversions if c not in 'diouFf%']) != 0
+
+    def __reduce__(self):       # pickle the format string, not the bound method
+        return (self.__class__, (self.fmt,))
+
+    def __call__(self, e):
+        if e == None or isnan(e):
+            return "{-}"
+        elif e == inf:
+            return r"$\infty$"
+        elif e == -inf:
+            return r"$-\infty$"
+        s = self.render(e)
+        if self.needsFix and 'e' in s:
+            s = self.fix(s, table=True) # fix 1e+2
+        return s
+
+class NumberFormat(StringFormat):
+    """Converts elements to float before formatting, None and NaN gives {-}, +-inf gives $\\pm\\infty$.
+    Raises NotNumeric for elements that can't be converted to float."""
+    numeric = True
+
+    def __call__(self, e):
+        try:
+            e = float(e)
+        except ValueError:
+            raise NotNumeric(e)
+        except TypeError:       # raised for None
+            return "{-}"
+        if e != e:              # NaN
+            return "{-}"
+        elif e == inf:
+            return r"$\infty$"
+        elif e == -inf:
+            return r"$-\infty$"
+        s = self.render(e)
+        if self.needsFix and 'e' in s:
+            s = self.fix(s, table=True) # fix 1e+2
+        return s
+
+class IntegerFormat(NumberFormat):
+    """str.format with an integer presentation type (d, x, X, o, b, c),
+    elements are converted to float as by NumberFormat and then to int."""
+    def __init__(self, fmt):
+        NumberFormat.__init__(self, fmt)
+        self.render = lambda e: fmt.format(int(e))
+        self.needsFix = False   # no e-notation, and 'e' is a hexadecimal digit
+
+def compileFormat(fmt):
+    """
+    input: printf (e.g. '$%.2f$') or str.format (e.g. '${:.2f}$') format string, or None
+    output: function formatting a single element
+    """
+    if fmt is None:
+        return MissingFormat()
+    if isStrFormat(fmt):
+        spec = _strformat.search(fmt).group(1) or ''
+        if spec[-1:] in ('e', 'E', 'f', 'F', 'g', 'G', 'n', '%'): # float presentation type
+            return NumberFormat(fmt)
+        if spec[-1:] in ('d', 'x', 'X', 'o', 'b', 'c'): # integer presentation type
+            return IntegerFormat(fmt)
+        return StringFormat(fmt)
+    if '%s' in fmt:
+        return StringFormat(fmt)
+    return NumberFormat(fmt)
+
+def formatPlan(formatColumn, n):
+    """
+    input: list of format strings (or compiled formats) formatColumn, number of columns n
+    output: list of n functions, plan[j](e) gives the LaTeX for element e in column j.
+    A missing format gives {-} for the whole column.
+    Elements that are not numbers raises NotNumeric, the caller should then
+    replace plan[j] with fallbackFormat(plan[j]) for the rest of the column.
+    """
+    plan = list()
+    for j in range(n):
+        try:
+            fmt = formatColumn[j]
+        except IndexError:
+            fmt = None
+        if not isinstance(fmt, (MissingFormat, StringFormat)):
+            fmt = compileFormat(fmt)
+        plan.append(fmt)
+    return plan
+
+def fallbackFormat(columnFormat):
+    # used when a numeric column contains something that is not a number
+    if columnFormat.strformat:
+        return StringFormat('{}')
+    return StringFormat('%s')
+
+def valueLines(matr, n, plan, headerColumn=None, tabs=0, formatted=False, used=None, start=0):
+    r"""
+    input: rows matr, number of columns n, list of column formats plan from formatPlan,
+    row labels headerColumn and the number of tabs to indent with
+    output: generator of the LaTeX lines, one per row, e.g. '\t\t{a} & $1$ & $2$\\\n'
+    With formatted=True the rows are already formatted cells (see vectorize.py), otherwise
+    each element is formatted with plan[j], which is replaced with fallbackFormat(plan[j])
+    at the first element that is not a number.
+    If used is a set, the columns where plan[j] formatted an element other than None as a number are added to it.
+    start is the index of the first row in matr, only used for error messages.
+    """
+    out = list()
+    write = out.append
+    if formatted:               # rows of already formatted cells
+        for i, row in enumerate(matr):
+            write("\t"*tabs)
+            if headerColumn != None:
+                try:
+                    write("{%s} & " % headerColumn[i])
+                except IndexError:
+                    write('&')
+            write(" & ".join(row))
+            write(r"\\")
+            write("\n")
+            yield ''.join(out)
+            del out[:]
+        return
+
+    for i, row in enumerate(matr):
+        if len(row) > n:
+            raise ValueError("Error: row %d has %d elements, expected at most %d, see the columns keyword" % (start + i, len(row), n))
+        write("\t"*tabs)
+        if n != 0 and headerColumn != None:
+            try:
+                write("{%s} & " % headerColumn[i])
+            except IndexError:
+                write('&')
+        for j in range(0, n):
+            try: # get current element
+                e = row[j]
+            except IndexError:
+                write("{-}")
+            else:
+                try:
+                    write(plan[j](e))
+                except NotNumeric: # can't convert to float, use string for the rest of the column
+                    plan[j] = fallbackFormat(plan[j])
+                    write(plan[j](e))
+                else:
+                    if used is not None and plan[j].numeric and e is not None:
+                        used.add(j)
+            if j != n-1:                # not last row
+                write(" & ")
+            else:                       # last row
+                write(r"\\")
+                write("\n")
+        yield ''.join(out)
+        del out[:]
@@ -16,17 +16,66 @@ along with matrix2latex. If not, see <http://www.gnu.org/licenses/>.
 import sys
 import os.path
 import warnings
-import math
 import re
-def isnan(e):
+import itertools
+import operator
+class _Transposed(object):
+    """Transposed view of a list of rows, row i is column i of matr.
+    Like zip(*matr), the number of rows is given by the shortest row in matr."""
+    def __init__(self, matr):
+        self.matr = matr
+        if len(matr) == 0:
+            self.m = 0
+        else:
+            self.m = min(len(row) for row in matr)
+
+    def __len__(self):
+        return self.m
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.m:
+            raise IndexError(i)
+        return [row[i] for row in self.matr]
+
+    def __iter__(self):
+        for i in range(self.m):
+            yield [row[i] for row in self.matr]
+
+try:
+    _izip, _imap = itertools.izip, itertools.imap # python 2
+except AttributeError:
+    _izip, _imap = zip, map
+
+def _streamRows(matr, n=None):
+    """Peek at the first row of the iterable matr without consuming it,
+    returns an iterator over all rows and the number of columns n,
+    taken from the first row unless given."""
+    rows = iter(matr)
     try:
-        return math.isnan(e)
-    except (TypeError, AttributeError):
-        return e == float("nan")
-
-from fixEngineeringNotation import fix
-from error import *                     # error handling
-from IOString import IOString
+        first = next(rows)
+    except StopIteration:       # empty
+        return rows, n or 0
+    rows = itertools.chain([first], rows)
+    try:
+        length = len(first)
+    except TypeError: # no length in this dimension (vector...)
+        # convert 1, 2 to [1], [2]
+        return ([e] for e in rows), n or 1
+    if n is None:
+        n = length
+    return rows, n
+
+from .fixEngineeringNotation import fix
+from .error import *                    # error handling
+from .IOString import IOString
+from .formatting import compileFormat, formatPlan, valueLines
+from .parallel import parallelValueLines, processPool
+from .cache import RenderCache, renderKey
+from .diskcache import DiskCache
+from .files import AtomicFile
+from .profiling import Profile, clock
+from . import metrics
+from .vectorize import loadArray, asNumericArray, asFrame, frameColumns, formatArrayRows, formatColumnsRows
 # Definitions
 # Matrix environments where alignment can be utilized. CHECK: Note alignment[0] used!
 matrix_alignment = ["pmatrix*","bmatrix*","Bmatrix*","vmatrix*","Vmatrix*"] # Needs mathtools package
@@ -52,6 +101,18 @@ def matrix2latex(matr, filename=None, *environments, **keywords):
       ...
 
     :param list matr: The numpy matrix/array or a nested list to convert.
+      Can also be any iterable of rows without a length, like a generator or a database cursor,
+      the rows are then formatted and written to filename one at a time without
+      reading the whole matrix into memory (see also ``columns``).
+      Numpy arrays of booleans, integers or floats are formatted a column at a time,
+      the output is identical to passing ``matr.tolist()``.
+      Pandas DataFrames are also formatted a column at a time, the index and columns
+      are used for headerColumn and headerRow, dates and times are printed as strings.
+      The path of a ``.npy`` file is memory mapped, numpy memmaps (like ``np.load(path, mmap_mode='r')``)
+      are read in blocks of rows that are formatted and written to filename one block at a time,
+      only one block of a read-only memmap is kept in memory.
+      As the table is also returned as a string, use iter_latex and write the chunks to a file
+      to keep the memory use bounded for tables larger than the available memory.
 
     :param str filename: File to place output, extension .tex is added automatically. File can be included in a LaTeX
       document by ``\input{filename}``. If filename is None
@@ -106,6 +167,7 @@ def matrix2latex(matr, filename=None, *environments, **keywords):
     :key format:
         Printf syntax format, e.g. ``$%.2f$``. Default is ``$%g$``.
         This format is then used for all the elements in the table.
+        The str.format syntax, e.g. ``${:.2f}$``, is also accepted.
 
     :key formatColumn:
         A list of printf-syntax formats, e.g. ``[$%.2f$, $%g$]``
@@ -123,6 +185,60 @@ def matrix2latex(matr, filename=None, *environments, **keywords):
         it will produce the correct amount depending on the number of columns.
         Default is ``"r"``.
 
+    :key columns:
+        The number of columns, by default the length of the longest row,
+        or the length of the first row if matr is an iterator of rows.
+        Rows with fewer elements are padded with ``{-}``, rows with more elements raises a ValueError.
+
+    :key workers:
+        The number of worker processes used to format the rows, for very large tables.
+        The rows are split in chunks of ``chunkSize`` rows that are formatted in parallel
+        and joined in order, the output is identical to the default ``workers=None``
+        (format in this process). Numeric numpy arrays are shared with the workers
+        through shared memory instead of being copied to each of them.
+        Pandas DataFrames with columns of different types are always formatted in this process.
+
+    :key chunkSize:
+        The number of rows in each chunk when ``workers`` is given,
+        by default a table is split in about 4 chunks per worker.
+
+    :key shardRows:
+        Split the table in files of at most this many rows when writing to filename,
+        for tables too large for TeX's memory. The rows are written to ``filename-001.tex``,
+        ``filename-002.tex``, ..., each a complete table with the begin block, headerRow and end block,
+        and filename gets an ``\input`` of each of them, which is also returned.
+        The caption and label are only in the first file. Ignored without a filename.
+
+    :key shardBytes:
+        Like ``shardRows``, split the table in files of at most this many characters
+        (but at least one row per file). Can be combined with ``shardRows``.
+
+    :key ifChanged:
+        If True, the output is written to a temporary file next to filename that replaces filename
+        only if the content differs, an unchanged file is not touched (and make or latexmk
+        do not rebuild the document). The file is also left as it was if rendering fails.
+
+    :key stream:
+        If True and filename is given, the output is written to the file as it is produced
+        instead of also being kept in memory, and None is returned. Combined with an iterator
+        of rows or a ``.npy`` file the memory use does not depend on the size of the table.
+        The file is written through a temporary file renamed to filename when done (as with ``ifChanged``),
+        so it is left as it was if rendering fails. Tables are not cached with ``stream``.
+
+    :key updated:
+        A list, the names of the files that were written are appended to it, with ``ifChanged``
+        only the files whose content changed.
+
+    :key profile:
+        A Profile, the time and number of calls of each phase of the rendering
+        (input conversion, formatting, writing, ...) are added to it, see Profile.
+
+    :key cache:
+        A RenderCache, the table is taken from the cache if this matrix was rendered with the same
+        arguments before, otherwise it is rendered and stored in the cache.
+        Only numeric numpy arrays and lists of numbers and strings are cached, see RenderCache.
+        A DiskCache keeps the tables in a directory instead, shared by processes and repeated builds.
+
     :key position:
         Used for the table environment to specify the optional parameter "position specifier"
         Default is ``'[' + 'htp' + ']'``
@@ -134,203 +250,630 @@ def matrix2latex(matr, filename=None, *environments, **keywords):
     :return str table:
       Returns the latex formated output as a string.
     '''
-    headerRow = None
-    headerColumn = None
-
-    #
-    # Convert to list
-    #
-    # If pandas
-    try:
-        headerColumn = list(matr.index)
-    except (AttributeError, TypeError):
-        pass
-    try:
-        headerRow = [list(matr.columns)]
-    except (AttributeError, TypeError):
-        pass
-    try:
-        matr = matr.to_records(index=False)
-    except AttributeError:
-        pass
-    # If numpy (vops: must be placed below pandas check)
-    try:
-        matr = matr.tolist()
-    except AttributeError:
-        pass # lets hope it looks like a list
-
-    #
-    # Define matrix-size
-    # 
-    m = len(matr)
-    try:
-        n = len(matr[0]) # may raise TypeError
-        for row in matr:
-            n = max(n, len(row)) # keep max length
-    except TypeError: # no length in this dimension (vector...)
-        # convert [1, 2] to [[1], [2]]
-        newMatr = list()
-        [newMatr.append([matr[ix]]) for ix in range(m)]
-        matr = newMatr
-        m = len(matr)
-        n = len(matr[0])
-    except IndexError:
-        m = 0
-        n = 0
-    #assert m > 0 and n > 0, "Expected positive matrix dimensions, got %g by %g matrix" % (m, n)
-#   Bug with transpose:
-#     # If header and/or column labels are longer use those lengths
-#     try:
-#         m = max(m, len(keywords['headerColumn'])) # keep max length
-#     except KeyError:
-#         pass
-#     try:
-#         n = max(n, len(keywords['headerRow'])) # keep max length
-#     except KeyError:
-#         pass
-    
-    #
-    # Default values
-    #
+    filename = keywords.pop('filename', filename)
+    cache = keywords.pop('cache', None)
+    updated = keywords.pop('updated', None)
+    profile = keywords.get('profile')
+    if profile is not None:
+        profile.start()
+    key = None
+    if (cache is not None and 'shardRows' not in keywords and 'shardBytes' not in keywords
+        and not keywords.get('stream')):
+        key = renderKey(matr, filename, environments, keywords)
+    table = None
+    if key is not None:
+        table = cache.get(key)
+        if table is None:
+            metrics.cacheMisses.inc()
+        else:
+            metrics.cacheHits.inc()
+    if profile is not None and cache is not None:
+        profile.lap('cache')
+    renderer = Renderer(*environments, **keywords)
+    if profile is not None:
+        profile.lap('keywords')
+    if table is not None:
+        filename = _texFilename(filename)
+        if filename is not None:
+            renderer._writeFile(filename, table)
+    else:
+        table = renderer.render(matr, filename)
+        if key is not None:
+            if profile is not None:
+                profile.start()
+            cache.put(key, table)
+            if profile is not None:
+                profile.lap('cache')
+    if updated is not None:
+        updated.extend(renderer.updated)
+    return table
+
+def iter_latex(matr, *environments, **keywords):
+    r'''
+    Generator counterpart to matrix2latex, yields the LaTeX output in chunks as it is produced:
+    the begin block, each header row, each row of values and the end block.
+    ``''.join(iter_latex(m, ...))`` is identical to ``matrix2latex(m, None, ...)``.
+
+    Takes the same environments and keywords as matrix2latex,
+    except that nothing is written to file, a ``filename`` keyword is only used for the default label.
+    The keywords are checked when iter_latex is called, not when the first chunk is requested.
+    Combined with an iterator of rows or a ``.npy`` file for matr, neither the matrix nor the output is held in memory.
+    '''
+    return Renderer(*environments, **keywords).iter_latex(matr)
 
-    # Keywords
-    formatNumber = "$%g$"
-    formatColumn = None
-    if n != 0:
-        alignment = "c"*n               # cccc
+def render_many(items, workers=None, chunksize=1):
+    r'''
+    Renders many tables in parallel, in a pool of worker processes.
+
+    :param list items: Jobs as ``(matr, filename, options)`` tuples (options may be left out),
+        each is rendered as ``matrix2latex(matr, filename, **options)``,
+        so filename is handled as usual (``.tex`` is added, the label defaults to the filename).
+        Environments can be given as ``options['environments']``.
+    :param int workers: The number of worker processes, defaults to the number of cores.
+        With ``workers=1`` the jobs are rendered in this process.
+    :param int chunksize: The number of jobs sent to a worker at a time,
+        use more than 1 for many small tables.
+
+    :return list results:
+        One result per job, in the same order as items.
+        Either the LaTeX string or, if the job failed, the exception it raised.
+    '''
+    items = list(items)
+    chunks = [items[i:i + chunksize] for i in range(0, len(items), chunksize)]
+    executor = None
+    if workers != 1 and len(chunks) > 1:
+        executor = processPool(workers) # None on python 2
+    if executor is None:
+        results = [_renderChunk(chunk)[0] for chunk in chunks]
     else:
-        alignment = "c"
+        with executor:
+            futures = [executor.submit(_renderChunk, chunk) for chunk in chunks]
+            results = list()
+            for chunk, future in zip(chunks, futures):
+                try:
+                    chunkResults, counts = future.result()
+                except Exception: # e.g. an item that can not be pickled, render it here instead
+                    chunkResults, counts = _renderChunk(chunk)[0], dict()
+                metrics.registry.addCounts(counts) # the metrics of the worker
+                results.append(chunkResults)
+    return [result for chunk in results for result in chunk]
+
+def _renderChunk(items):
+    # worker for render_many, returns the results and the metrics counted for them
+    before = metrics.registry.counts()
+    results = list()
+    for item in items:
+        try:
+            if len(item) == 2:
+                matr, filename = item
+                options = dict()
+            else:
+                matr, filename, options = item
+            results.append(matrix2latex(matr, filename, **options))
+        except Exception as e:
+            results.append(e)
+    after = metrics.registry.counts()
+    return results, dict((name, after[name] - before[name]) for name in after)
+
+class Renderer(object):
+    r'''
+    The environments and keywords of matrix2latex, checked and compiled once,
+    for rendering many matrices with the same options::
 
-    caption = None
-    label = None
-    position = "htp"            # position specifier for floating table environment
+        renderer = Renderer("table", "center", "tabular", format="$%.2f$", caption="Results")
+        for matr, filename in tables:
+            renderer.render(matr, filename)
 
-    # 
-    # Conflicts
-    #
-    if "format" in keywords and "formatColumn" in keywords:
-        warnings.warn('Specifying both format and formatColumn is not supported, using formatColumn')
-        del keywords["format"]
-        
-    #
-    # User-defined values
-    # 
-    for key in keywords:
-        value = keywords[key]
-        if key == "format":
-            assertKeyFormat(value)
-            formatNumber = value
-            formatColumn = None         # never let both formatColumn and formatNumber to be defined
-        elif key == "formatColumn":
-            formatColumn = value
-            formatNumber = None
-        elif key == "alignment":
-            if len(value) == 1:
-                alignment = value*n # rrrr
+    ``Renderer(*environments, **keywords).render(matr, filename)`` is identical to
+    ``matrix2latex(matr, filename, *environments, **keywords)``.
+    Options depending on the matrix (default alignment, labels from pandas, ...) are resolved for each matrix.
+    Renderer objects can be pickled, e.g. to send them to worker processes.
+
+    :raises ValueError: for unknown keywords.
+    '''
+    def __init__(self, *environments, **keywords):
+        keywords = dict(keywords)
+        self.filename = None
+        self.columns = keywords.pop('columns', None)
+        self.transpose = bool(keywords.pop('transpose', False))
+        self.workers = keywords.pop('workers', None)
+        self.chunkSize = keywords.pop('chunkSize', None)
+        self.shardRows = keywords.pop('shardRows', None)
+        self.shardBytes = keywords.pop('shardBytes', None)
+        self.ifChanged = bool(keywords.pop('ifChanged', False))
+        self.stream = bool(keywords.pop('stream', False))
+        self.updated = list()           # files written by the last call to render
+        self.profile = keywords.pop('profile', None)
+        for key, value in (('shardRows', self.shardRows), ('shardBytes', self.shardBytes)):
+            if value is not None and value < 1:
+                raise ValueError("Error: %s must be a positive integer, got %s" % (key, value))
+
+        #
+        # Default values
+        #
+
+        # Keywords
+        formatNumber = "$%g$"
+        formatColumn = None
+        self.alignment = None           # depends on the number of columns, see _table
+        self.headerRowGiven = False     # if not given, pandas labels are used
+        self.headerRow = None
+        self.headerColumnGiven = False
+        self.headerColumn = None
+        self.caption = None
+        self.label = None
+        self.position = "htp"           # position specifier for floating table environment
+
+        # 
+        # Conflicts
+        #
+        if "format" in keywords and "formatColumn" in keywords:
+            warnings.warn('Specifying both format and formatColumn is not supported, using formatColumn')
+            del keywords["format"]
+
+        #
+        # User-defined values
+        # 
+        for key in keywords:
+            value = keywords[key]
+            if key == "format":
+                assertKeyFormat(value)
+                formatNumber = value
+                formatColumn = None         # never let both formatColumn and formatNumber to be defined
+            elif key == "formatColumn":
+                formatColumn = value
+                formatNumber = None
+            elif key == "alignment":
+                self.alignment = value
+            elif key == "headerRow":
+                self.headerRowGiven = True
+                if value == None:
+                    self.headerRow = None
+                else:
+                    if not(type(value[0]) == list):
+                        value = [value]         # just one header
+                    #assertListString(value, "headerRow") # todo: update
+                    self.headerRow = [list(row) for row in value]
+            elif key == "headerColumn":
+                self.headerColumnGiven = True
+                if value == None:
+                    self.headerColumn = None
+                else:
+                    assertListString(value, "headerColumn")
+                    self.headerColumn = list(value)
+            elif key == "caption":
+                assertStr(value, "caption")
+                self.caption = value
+            elif key == "label":
+                assertStr(value, "label")
+                if value.startswith('tab:'):
+                    self.label = value[len('tab:'):] # this will be added later in the code, avoids 'tab:tab:' as label
+                else:
+                    self.label = value
+            elif key == "filename":
+                assertStr(value, "filename")
+                self.filename = value
+            elif key == "position":
+                assertStr(value, "position")
+                self.position = value
+            elif key == "environments":
+                environments = value
+            else:
+                raise ValueError("Error: key not recognized '%s'" % key)
+
+        # Environments
+        if environments is None:    # environments=None passed, do not add any environments.
+            environments = []
+        elif len(environments) == 0: # no environment give, assume table
+            environments = ("table", "center", "tabular")
+        self.environments = list(environments)
+
+        # Formats, compiled once, see formatting.py
+        if formatColumn == None:
+            self.formatNumber = compileFormat(formatNumber)
+            self.formatColumn = None
+        else:
+            self.formatNumber = None
+            self.formatColumn = [compileFormat(fmt) for fmt in formatColumn]
+
+    def render(self, matr, filename=None):
+        """
+        Converts matr to LaTeX, see matrix2latex.
+        filename defaults to the filename keyword given to the Renderer.
+        """
+        if filename is None:
+            filename = self.filename
+        self.updated = list()
+        table = self._table(matr, filename)
+        if table['filename'] is not None and (self.shardRows is not None or self.shardBytes is not None):
+            return self._writeShards(table)
+        f = None
+        if table['filename'] is not None:
+            f = self._open(table['filename'])
+        stream = f is not None and self.stream
+        out = f if stream else IOString(f) # IOString also keeps the output to return
+
+        try:
+            if self.profile is None:
+                size = 0
+                write = out.write
+                for chunk in _emit(table):
+                    write(chunk)
+                    size += len(chunk)
             else:
-                alignment = value
-            assertKeyAlignment(alignment, n)
-        elif key == "headerRow":
-            if value == None:
-                headerRow = None
+                size = _emitProfiled(table, out.write, self.profile)
+        except BaseException:
+            if f is not None:
+                self._discard(f)
+            raise
+
+        if f is not None:
+            self._close(f, table['filename'])
+        _count(table, size)
+        if stream:
+            return None
+        return out.__str__()
+
+    def _open(self, filename):
+        if self.ifChanged:
+            return AtomicFile(filename)
+        if self.stream:
+            return AtomicFile(filename, ifChanged=False)
+        return open(filename, 'w')
+
+    def _close(self, f, filename):
+        f.close()
+        if getattr(f, 'updated', True):
+            self.updated.append(filename)
+
+    def _discard(self, f):
+        # a failed render, AtomicFile leaves the file as it was
+        if isinstance(f, AtomicFile):
+            f.discard()
+        else:
+            f.close()
+
+    def _writeFile(self, filename, text):
+        f = self._open(filename)
+        try:
+            f.write(text)
+        except BaseException:
+            self._discard(f)
+            raise
+        self._close(f, filename)
+
+    def _writeShards(self, table):
+        """Writes the table to name-001.tex, name-002.tex, ... with at most shardRows rows
+        and shardBytes characters each, returns the content of name.tex that inputs them."""
+        base = table['filename'][:-len('.tex')]
+        begin = [''.join(_begin(table)),  # caption and label only in the first shard
+                 ''.join(_begin(dict(table, caption=None, label=None)))]
+        end = _end(table)
+        names = list()
+        def openShard():
+            names.append('%s-%03d' % (base, len(names) + 1))
+            f = self._open(names[-1] + '.tex')
+            f.write(begin[len(names) != 1])
+            return f, len(begin[len(names) != 1])
+
+        f = None
+        total = 0
+        try:
+            for line in _values(dict(table, workers=None)): # one line per row
+                if f is not None and ((self.shardRows is not None and rows >= self.shardRows) or
+                                      (self.shardBytes is not None and size + len(line) + len(end) > self.shardBytes)):
+                    f.write(end)
+                    self._close(f, names[-1] + '.tex')
+                    total += size + len(end)
+                    f = None
+                if f is None:
+                    f, size = openShard()
+                    rows = 0
+                f.write(line)
+                rows += 1
+                size += len(line)
+            if f is None:           # no rows
+                f, size = openShard()
+            f.write(end)
+        except BaseException:
+            if f is not None:
+                self._discard(f)
+            raise
+        self._close(f, names[-1] + '.tex')
+        total += size + len(end)
+
+        master = ''.join(r'\input{%s}' % name + '\n' for name in names)
+        self._writeFile(table['filename'], master)
+        _count(table, total + len(master))
+        return master
+
+    def iter_latex(self, matr):
+        """Generator of LaTeX chunks for matr, see iter_latex. Nothing is written to file."""
+        table = self._table(matr, self.filename)
+        table['filename'] = None
+        return _emitCounted(table)
+
+    def _table(self, matr, filename):
+        """Converts matr to a list (or iterator) of rows and resolves the options that depend on it.
+        Returns a dictionary used by _emit."""
+        headerRow = self.headerRow
+        headerColumn = self.headerColumn
+        profile = self.profile
+        if profile is not None:
+            profile.start()
+        matr = loadArray(matr)      # path of a .npy file, memory mapped
+
+        #
+        # Convert to list
+        #
+        # If pandas (labels are only read if not given as keywords, and never transposed)
+        if not self.headerColumnGiven and not self.transpose:
+            try:
+                headerColumn = list(matr.index)
+            except (AttributeError, TypeError):
+                pass
+        if not self.headerRowGiven and not self.transpose:
+            try:
+                headerRow = [list(matr.columns)]
+            except (AttributeError, TypeError):
+                pass
+        frame = asFrame(matr)       # DataFrames are formatted column-wise, see vectorize.py
+        if frame is None:
+            try:
+                matr = matr.to_records(index=False)
+            except AttributeError:
+                pass
+        # If numpy (vops: must be placed below pandas check)
+        array = None
+        if frame is None:
+            array = asNumericArray(matr) # numeric arrays are formatted column-wise, see vectorize.py
+            if array is not None:
+                matr = array
             else:
-                if not(type(value[0]) == list):
-                    value = [value]         # just one header
-                #assertListString(value, "headerRow") # todo: update
-                headerRow = list(value)
-        elif key == "headerColumn":
-            if value == None:
-                headerColumn = None
+                try:
+                    matr = matr.tolist()
+                except AttributeError:
+                    pass # lets hope it looks like a list
+
+        if profile is not None:
+            profile.lap('convert')
+
+        #
+        # Define matrix-size
+        # 
+        n = self.columns
+        if frame is not None and n is not None and n != frame.shape[1]:
+            frame = None
+            matr = matr.to_records(index=False).tolist()
+        if array is not None and n is not None and n != array.shape[1]:
+            array = None
+            matr = matr.tolist()
+        if frame is not None:
+            n = frame.shape[1]
+        elif array is not None:
+            n = array.shape[1]
+        elif not hasattr(matr, '__len__'): # iterator/generator of rows, e.g. a database cursor
+            matr, n = _streamRows(matr, n)
+        else:
+            try:
+                if n is None:
+                    n = len(matr[0]) # may raise TypeError
+                    for row in matr:
+                        n = max(n, len(row)) # keep max length
+                else:
+                    len(matr[0])    # column count given, skip the scan, but check for vector
+            except TypeError: # no length in this dimension (vector...)
+                # convert [1, 2] to [[1], [2]]
+                matr = [[e] for e in matr]
+                if n is None:
+                    n = 1
+            except IndexError:
+                if n is None:
+                    n = 0
+        #assert m > 0 and n > 0, "Expected positive matrix dimensions, got %g by %g matrix" % (m, n)
+    #   Bug with transpose:
+    #     # If header and/or column labels are longer use those lengths
+    #     try:
+    #         m = max(m, len(keywords['headerColumn'])) # keep max length
+    #     except KeyError:
+    #         pass
+    #     try:
+    #         n = max(n, len(keywords['headerRow'])) # keep max length
+    #     except KeyError:
+    #         pass
+
+        #
+        # Transpose, without copying the matrix. All other keywords apply to the transposed matrix.
+        #
+        if self.transpose:
+            if frame is not None:
+                if len(set(frame.dtypes)) == 1: # uniform frame, may be a numeric array
+                    array = asNumericArray(frame)
+                if array is not None:
+                    array = array.T # strided view
+                    n = array.shape[1]
+                else:
+                    n = frame.shape[0]
+                    matr = (col.tolist() for col in frameColumns(frame)) # column j becomes row j
+                frame = None
+            elif array is not None:
+                array = array.T     # strided view
+                n = array.shape[1]
             else:
-                assertListString(value, "headerColumn")
-                headerColumn = list(value)
-        elif key == "caption":
-            assertStr(value, "caption")
-            caption = value
-        elif key == "label":
-            assertStr(value, "label")
-            if value.startswith('tab:'):
-                label = value[len('tab:'):] # this will be added later in the code, avoids 'tab:tab:' as label
+                if not hasattr(matr, '__len__'): # iterator, has to be read
+                    matr = list(matr)
+                matr = _Transposed(matr)
+                n = len(matr.matr) if len(matr) != 0 else 0
+        if profile is not None:
+            profile.lap('dimensions')
+
+        if self.alignment is None:
+            if n != 0:
+                alignment = "c"*n       # cccc
             else:
-                label = value
-        elif key == "filename":
-            assertStr(value, "filename")
-            filename = value
-        elif key == "position":
-            assertStr(value, "position")
-            position = value
-        elif key == "environments":
-            environments = value
-        elif key == "transpose":
-            newMatr = list(zip(*matr))
-#             for j in range(0, n):
-#                 row = list()
-#                 for i in range(0, m):
-#                     row.append(matr[i][j])
-#                 newMatr.append(row)
-            copyKeywords = dict(keywords) # can't del original since we are inside for loop.
-            del copyKeywords['transpose']
-            # Recursion!
-            return matrix2latex(newMatr, filename, *environments, **copyKeywords)
+                alignment = "c"
+        elif len(self.alignment) == 1:
+            alignment = self.alignment*n # rrrr
         else:
-            raise ValueError("Error: key not recognized '%s'" % key)
-
-    if headerColumn != None:
-        alignment = "r" + alignment
-
-    # Environments
-    if environments is None:    # environments=None passed, do not add any environments.
-        environments = []
-    elif len(environments) == 0: # no environment give, assume table
-        environments = ("table", "center", "tabular")
-
-    if formatColumn == None:
-        formatColumn = list()
-        for j in range(0, n):
-            formatColumn.append(formatNumber)
+            alignment = self.alignment
+        assertKeyAlignment(alignment, n)
 
-    if headerColumn != None and headerRow != None and len(headerRow[0]) == n:
-        for i in range(len(headerRow)):
-            headerRow[i].insert(0, "")
+        if headerColumn != None:
+            alignment = "r" + alignment
 
-    # 
-    # Set outputFile
-    # 
-    f = None
+        if self.formatColumn == None:
+            plan = [self.formatNumber]*n
+        else:
+            plan = formatPlan(self.formatColumn, n) # one formatting function per column
+        if profile is not None:
+            plan = profile.timedPlan(plan)
+
+        if headerColumn != None and headerRow != None and len(headerRow[0]) == n:
+            headerRow = [[""] + row for row in headerRow]
+
+        # number of rows for the metrics, counted while formatting for iterators
+        rows, counter = None, None
+        if frame is not None:
+            rows = frame.shape[0]
+        elif array is not None:
+            rows = array.shape[0]
+        elif hasattr(matr, '__len__'):
+            rows = len(matr)
+        else:
+            counter = itertools.count()
+            matr = _imap(_first, _izip(matr, counter))
+
+        if frame is not None:
+            matr = formatColumnsRows(frameColumns(frame), plan)
+        elif array is not None:
+            matr = formatArrayRows(array, plan)
+
+        #
+        # Set outputFile
+        #
+        label = self.label
+        filename = _texFilename(filename)
+        if filename is not None and label == None:
+            label = os.path.basename(filename) # get basename
+            label = label[:-len(".tex")]  # remove extension
+        if profile is not None:
+            profile.lap('plan')
+
+        return dict(matr=matr, n=n, rows=rows, counter=counter, formatted=frame is not None or array is not None, plan=plan,
+                    array=array, workers=self.workers, chunkSize=self.chunkSize,
+                    filename=filename, environments=self.environments,
+                    alignment=alignment,
+                    headerRow=headerRow, headerColumn=headerColumn,
+                    caption=self.caption, label=label, position=self.position)
+
+_first = operator.itemgetter(0)
+
+def _count(table, size):
+    # metrics of a rendered table as returned by _table, size is the number of characters written
+    rows = table['rows']
+    if rows is None:
+        rows = next(table['counter']) # the rows consumed
+    metrics.tables.inc()
+    metrics.cells.inc(rows*table['n'])
+    metrics.charactersEmitted.inc(size)
+
+def _texFilename(filename):
+    # filename with the .tex extension, None if it is not a (non-empty) string
     if isinstance(filename, str) and filename != '':
         if not filename.endswith('.tex'): # assure propper file extension
             filename += '.tex'
-        f = open(filename, 'w')
-        if label == None:
-            label = os.path.basename(filename) # get basename
-            label = label[:-len(".tex")]  # remove extension
+        return filename
+    return None
+
+def _emit(table):
+    """Generator of LaTeX chunks for a table as returned by _table,
+    one chunk for the begin block, each header row, each row of values and the end block."""
+    for chunk in _begin(table):
+        yield chunk
+    for line in _values(table):
+        yield line
+    yield _end(table)
+
+def _emitCounted(table):
+    # _emit, counting the table in the metrics once all of it is emitted
+    size = 0
+    for chunk in _emit(table):
+        size += len(chunk)
+        yield chunk
+    _count(table, size)
+
+def _emitProfiled(table, write, profile):
+    """Writes the chunks of _emit with write, adding the time spent on formatting and writing
+    and the number of rows, cells and bytes to profile. Returns the number of characters written."""
+    size = [0]
+    def timedWrite(chunk):
+        start = clock()
+        write(chunk)
+        profile.add('write', clock() - start)
+        profile.bytes += len(chunk.encode('utf-8'))
+        size[0] += len(chunk)
+
+    rows = 0
+    start = clock()
+    for chunk in _begin(table):
+        profile.add('format', clock() - start)
+        timedWrite(chunk)
+        start = clock()
+    for lines in _values(table):
+        profile.add('format', clock() - start)
+        rows += lines.count('\n') # one row per line, more in a chunk from the workers
+        timedWrite(lines)
+        start = clock()
+    end = _end(table)
+    profile.add('format', clock() - start)
+    timedWrite(end)
+    profile.tables += 1
+    profile.rows += rows
+    profile.cells += rows*table['n']
+    return size[0]
+
+def _begin(table):
+    """Generator of the begin block and the header rows of a table as returned by _table"""
+    environments = table['environments']
+    alignment = table['alignment']
+    headerRow = table['headerRow']
+    caption = table['caption']
+    label = table['label']
+    position = table['position']
+
+    out = list()
+    write = out.append
+    def flush():
+        chunk = ''.join(out)
+        del out[:]
+        return chunk
 
-    f = IOString(f)
     #
     # Begin block
     # 
     for ixEnv in range(0, len(environments)):
-        f.write("\t"*ixEnv)
-        f.write(r"\begin{%s}" % environments[ixEnv])
+        write("\t"*ixEnv)
+        write(r"\begin{%s}" % environments[ixEnv])
         # special environments:
         if environments[ixEnv] == "table":
-            f.write("[" + position + "]")
+            write("[" + position + "]")
         elif environments[ixEnv] == "center":
             if caption != None:
-                f.write("\n"+"\t"*ixEnv)
-                f.write(r"\caption{%s}" % fix(caption))
+                write("\n"+"\t"*ixEnv)
+                write(r"\caption{%s}" % fix(caption))
             if label != None:
-                f.write("\n"+"\t"*ixEnv)
-                f.write(r"\label{tab:%s}" % label)
+                write("\n"+"\t"*ixEnv)
+                write(r"\label{tab:%s}" % label)
         elif environments[ixEnv] in table_alignment:
-            f.write("{" + alignment + "}\n")
-            f.write("\t"*ixEnv)
-            f.write(r"\toprule")
+            write("{" + alignment + "}\n")
+            write("\t"*ixEnv)
+            write(r"\toprule")
         elif environments[ixEnv] in matrix_alignment:
-            f.write("[" + alignment[0] + "]\n") #These environment you can add
+            write("[" + alignment[0] + "]\n") #These environment you can add
         # newline
-        f.write("\n")
+        write("\n")
     tabs = len(environments)            # number of \t to use
+    yield flush()
 
     # 
     # Table block
@@ -341,7 +884,7 @@ def matrix2latex(matr, filename=None, *environments, **keywords):
         for row in range(len(headerRow)): # for each header
             i = 0
             start, end = list(), list() # of cmidrule
-            f.write("\t"*tabs)    
+            write("\t"*tabs)    
             while i < len(headerRow[row]): # for each element (skipping repeating ones)
                 j = 1
                 # check for legal index then check if current element is equal to next (repeating)
@@ -350,87 +893,56 @@ def matrix2latex(matr, filename=None, *environments, **keywords):
                     while repeating:        # figure out how long it repeats (j)
                         j += 1
                         repeating = i+j < len(headerRow[row]) and headerRow[row][i] == headerRow[row][i + j]
-                    f.write(r'\multicolumn{%d}{c}{%s}' % (j, headerRow[row][i])) # multicol heading
+                    write(r'\multicolumn{%d}{c}{%s}' % (j, headerRow[row][i])) # multicol heading
                     start.append(i);end.append(j+i)
                     i += j                 # skip ahed
                 else:
-                    f.write('{%s}' % headerRow[row][i]) # normal heading
+                    write('{%s}' % headerRow[row][i]) # normal heading
                     i += 1
                 if i < len(headerRow[row]): # if not last element
-                    f.write(' & ')
+                    write(' & ')
                     
-            f.write(r'\\')
+            write(r'\\')
             for s, e in zip(start, end):
-                f.write(r'\cmidrule(r){%d-%d}' % (s+1, e))
-            f.write('\n')
+                write(r'\cmidrule(r){%d-%d}' % (s+1, e))
+            write('\n')
+            yield flush()
         if len(start) == 0:             # do not use if cmidrule is used on last header
-            f.write('\t'*tabs)
-            f.write('\\midrule\n')
-
-    # Values
-    for i in range(0, m):
-        f.write("\t"*tabs)
-        for j in range(0, n):
-
-            if j == 0:                  # first row
-                if headerColumn != None:
-                    try:
-                        f.write("{%s} & " % headerColumn[i])
-                    except IndexError:
-                        f.write('&')
-
-            try: # get current element
-                if '%s' not in formatColumn[j]:
-                    try:
-                        e = float(matr[i][j]) # current element
-                    except ValueError: # can't convert to float, use string
-                        formatColumn[j] = '%s'
-                        e = matr[i][j]
-                    except TypeError:       # raised for None
-                        e = None
-                else:
-                    e = matr[i][j]
-            except IndexError:
-                e = None
-                
-            if e == None or isnan(e):#e == float('NaN'):
-                f.write("{-}")
-            elif e == float('inf'):
-                f.write(r"$\infty$")
-            elif e == float('-inf'):
-                f.write(r"$-\infty$")                
-            else:
-                fcj = formatColumn[j]
-
-                formated = fcj % e
-                formated = fix(formated, table=True) # fix 1e+2
-                f.write('%s' % formated)
-            if j != n-1:                # not last row
-                f.write(" & ")
-            else:                       # last row
-                f.write(r"\\")
-                f.write("\n")
+            write('\t'*tabs)
+            write('\\midrule\n')
+            yield flush()
+
+def _values(table):
+    """Generator of the rows of values of a table as returned by _table, one line per row
+    (or one chunk of lines per worker chunk, see parallel.py)"""
+    plan = list(table['plan'])  # copy, a column may fall back to strings
+    tabs = len(table['environments']) # number of \t to use
+    if table['workers'] not in (None, 1):
+        return parallelValueLines(table['matr'], table['n'], plan, table['headerColumn'], tabs, table['formatted'],
+                                  table['array'], table['workers'], table['chunkSize'])
+    return valueLines(table['matr'], table['n'], plan, table['headerColumn'], tabs, table['formatted'])
+
+def _end(table):
+    """The end block of a table as returned by _table"""
+    environments = table['environments']
+    out = list()
+    write = out.append
 
-    #
-    # End block
-    #
     for ixEnv in range(0, len(environments)):
         ixEnv = len(environments)-1 - ixEnv # reverse order
         # special environments:
         if environments[ixEnv] == "center":
             pass
         elif environments[ixEnv] == "tabular":
-            f.write("\t"*ixEnv)
-            f.write(r"\bottomrule"+"\n")
-        f.write("\t"*ixEnv)
-        f.write(r"\end{%s}" % environments[ixEnv])
+            write("\t"*ixEnv)
+            write(r"\bottomrule"+"\n")
+        write("\t"*ixEnv)
+        write(r"\end{%s}" % environments[ixEnv])
         if ixEnv != 0:
-            f.write("\n")
-
-    f.close()
-    return f.__str__()
+            write("\n")
+    return ''.join(out)
 
-if __name__ == '__main__':
+if __name__ == '__main__': # python -m matrix2latex.matrix2latex
 #     m = matrix('1 2 4;3 4 6')
 #     m = matrix('1 2 4;2 2 1;2 1 2')
     m = [[1, 2, 3], [3, 4, 5]]
@@ -0,0 +1,162 @@
+"""This file is part of matrix2latex.
+
+matrix2latex is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+matrix2latex is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with matrix2latex. If not, see <http://www.gnu.org/licenses/>.
+"""
+# Counters and histograms of the tables rendered in this process, for long running services:
+#   from matrix2latex import metrics
+#   metrics.registry.toDict()          # {'matrix2latex_tables_total': 12, ...}
+#   metrics.registry.toPrometheus()    # text exposition format, e.g. for a /metrics endpoint
+# Unlike Profile, the metrics are always collected, a few additions per table.
+import threading
+from collections import OrderedDict
+
+def _number(value):
+    # prometheus text format of a float or int
+    if value == float('inf'):
+        return '+Inf'
+    if value == int(value):
+        return '%d' % value
+    return repr(float(value))
+
+class Counter(object):
+    """A number that only increases, e.g. the number of tables rendered"""
+    kind = 'counter'
+
+    def __init__(self, name, help, lock):
+        self.name = name
+        self.help = help
+        self.lock = lock
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def reset(self):
+        with self.lock:
+            self.value = 0
+
+    def toDict(self):
+        return self.value
+
+    def samples(self):
+        return [(self.name, self.value)]
+
+class Histogram(object):
+    """Counts of observations (e.g. compile durations) in cumulative buckets, with their sum and count"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, lock, buckets):
+        self.name = name
+        self.help = help
+        self.lock = lock
+        self.buckets = sorted(buckets)
+        if not self.buckets or self.buckets[-1] != float('inf'):
+            self.buckets.append(float('inf'))
+        self.reset()
+
+    def observe(self, value):
+        with self.lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            self.sum += value
+            self.count += 1
+
+    def reset(self):
+        with self.lock:
+            self.counts = [0]*len(self.buckets)
+            self.sum = 0.
+            self.count = 0
+
+    def cumulative(self):
+        """List of (upper bound, number of observations <= upper bound)"""
+        total = 0
+        out = list()
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            out.append((bound, total))
+        return out
+
+    def toDict(self):
+        return dict(buckets=OrderedDict(self.cumulative()), sum=self.sum, count=self.count)
+
+    def samples(self):
+        out = [('%s_bucket{le="%s"}' % (self.name, _number(bound)), count) for bound, count in self.cumulative()]
+        out.append((self.name + '_sum', self.sum))
+        out.append((self.name + '_count', self.count))
+        return out
+
+class Registry(object):
+    """Named counters and histograms, exported with toDict or toPrometheus"""
+    def __init__(self):
+        self.metrics = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _add(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError("Error: metric '%s' already registered" % metric.name)
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help):
+        """Registers and returns a new Counter"""
+        return self._add(Counter(name, help, self.lock))
+
+    def histogram(self, name, help, buckets=(.01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)):
+        """Registers and returns a new Histogram with the given bucket upper bounds"""
+        return self._add(Histogram(name, help, self.lock, buckets))
+
+    def counts(self):
+        """Dictionary from counter name to value, e.g. for a worker process to report its counts, see addCounts"""
+        return dict((name, metric.value) for name, metric in self.metrics.items() if metric.kind == 'counter')
+
+    def addCounts(self, counts):
+        """Adds counts, a dictionary from counter name to amount, to the counters"""
+        for name, amount in counts.items():
+            if amount:
+                self.metrics[name].inc(amount)
+
+    def reset(self):
+        """Sets all metrics to zero"""
+        for metric in self.metrics.values():
+            metric.reset()
+
+    def toDict(self):
+        """Dictionary from metric name to its value (counters) or buckets, sum and count (histograms)"""
+        return OrderedDict((name, metric.toDict()) for name, metric in self.metrics.items())
+
+    def toPrometheus(self):
+        """The metrics in the prometheus text exposition format"""
+        lines = list()
+        for metric in self.metrics.values():
+            lines.append('# HELP %s %s' % (metric.name, metric.help.replace('\\', r'\\').replace('\n', r'\n')))
+            lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+            for name, value in metric.samples():
+                lines.append('%s %s' % (name, _number(value)))
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+tables = registry.counter('matrix2latex_tables_total', 'Tables rendered by matrix2latex.')
+cells = registry.counter('matrix2latex_cells_total', 'Cells formatted by matrix2latex.')
+charactersEmitted = registry.counter('matrix2latex_emitted_characters_total',
+                                     'Characters of LaTeX emitted by matrix2latex and iter_latex.')
+cacheHits = registry.counter('matrix2latex_cache_hits_total', 'Tables and images found in a cache.')
+cacheMisses = registry.counter('matrix2latex_cache_misses_total', 'Tables and images not found in a cache.')
+compileSeconds = registry.histogram('matrix2image_compile_seconds', 'Duration of the tex calls of render.matrix2image.')
+compileFailures = registry.counter('matrix2image_compile_failures_total', 'Failed tex calls of render.matrix2image.')
+formatFallbacks = registry.counter('matrix2image_format_fallbacks_total',
+                                   'Compiles with a precompiled format that failed and were done again without it.')
@@ -0,0 +1,168 @@
+"""This file is part of matrix2latex.
+
+matrix2latex is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+matrix2latex is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with matrix2latex. If not, see <http://www.gnu.org/licenses/>.
+"""
+# Formats the rows of a single large table in worker processes, see the workers keyword of matrix2latex.
+# The rows are split in chunks that are formatted in parallel and joined in order,
+# giving the same output as formatting.valueLines in this process.
+import os
+import itertools
+from collections import deque
+
+from .formatting import valueLines, fallbackFormat
+from .vectorize import formatArrayRows
+
+def processPool(workers=None):
+    """
+    input: number of worker processes, None for the number of cores
+    output: concurrent.futures.ProcessPoolExecutor, or None on python 2
+    concurrent.futures is imported here as it is slow to import and only needed with workers.
+    """
+    try:
+        import concurrent.futures
+    except ImportError:
+        return None
+    return concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+
+def _formatRows(rows, start, plan, n, headerColumn, tabs):
+    # worker, formats a list of rows, returns the LaTeX, the columns where a number was formatted
+    # and the columns that fell back to a string format (see valueLines)
+    initial = list(plan)
+    used = set()
+    text = ''.join(valueLines(rows, n, plan, headerColumn, tabs, used=used, start=start))
+    fallen = set(j for j in range(n) if plan[j] is not initial[j])
+    return text, used, fallen
+
+def _formatArray(block, start, plan, n, headerColumn, tabs):
+    # worker, formats a numeric array, given as a chunk of the array
+    # or as (name, shape, dtype, start, stop) of an array in shared memory
+    shm = None
+    if isinstance(block, tuple):
+        import numpy as np
+        from multiprocessing import shared_memory
+        name, shape, dtype, first, stop = block
+        shm = shared_memory.SharedMemory(name=name)
+        block = np.ndarray(shape, dtype=dtype, buffer=shm.buf)[first:stop]
+    text = ''.join(valueLines(formatArrayRows(block, plan), n, plan, headerColumn, tabs, formatted=True))
+    del block                   # release the buffer before closing
+    if shm is not None:
+        shm.close()
+    return text, set(), set()
+
+def _share(array):
+    # copy of the numpy array in shared memory, None if not supported
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:         # python < 3.8, array chunks are pickled
+        return None
+    if array.nbytes == 0:
+        return None
+    import numpy as np
+    shm = shared_memory.SharedMemory(create=True, size=array.nbytes)
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    shared[...] = array
+    del shared                  # release the buffer, shm is closed by the caller
+    return shm
+
+def _chunks(matr, array, chunkSize, shm):
+    # (worker, block, start) for each chunk of rows
+    if array is not None:
+        m = array.shape[0]
+        for start in range(0, m, chunkSize):
+            stop = min(start + chunkSize, m)
+            if shm is not None:
+                block = (shm.name, array.shape, array.dtype, start, stop)
+            else:
+                block = array[start:stop]
+            yield _formatArray, block, start
+    else:
+        rows = iter(matr)
+        start = 0
+        while True:
+            block = list(itertools.islice(rows, chunkSize))
+            if len(block) == 0:
+                return
+            yield _formatRows, block, start
+            start += len(block)
+
+def parallelValueLines(matr, n, plan, headerColumn=None, tabs=0, formatted=False,
+                       array=None, workers=None, chunkSize=None):
+    """
+    input: as formatting.valueLines, array is the numeric numpy array matr was formatted from (or None),
+    the number of worker processes and the number of rows in each chunk
+    output: generator of the LaTeX lines, one string per chunk of rows
+
+    Rows are formatted in this process if they are already formatted cells
+    (a DataFrame with columns of different types) or if concurrent.futures is missing.
+    A numeric array is copied once to shared memory where the workers read their chunk from.
+
+    A column of plan falls back to a string format at its first element that is not a number,
+    the workers do not know if this happened in an earlier chunk. A chunk where a worker formatted
+    a number in such a column is formatted again in this process, as is a chunk whose worker failed
+    (e.g. rows that can not be pickled), so the output is always the same as valueLines.
+    """
+    executor = None
+    if not formatted or array is not None:
+        executor = processPool(workers)
+    if executor is None:
+        for line in valueLines(matr, n, plan, headerColumn, tabs, formatted):
+            yield line
+        return
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunkSize is None:
+        try:
+            m = len(array if array is not None else matr)
+        except TypeError:       # iterator
+            m = 1024*workers
+        chunkSize = max(1, -(-m // (4*workers))) # about 4 chunks per worker
+
+    shm = None
+    if array is not None:
+        shm = _share(array)
+    try:
+        with executor:
+            def submit(chunk):
+                worker, block, start = chunk
+                if headerColumn is None:
+                    labels = None
+                else:
+                    labels = headerColumn[start:start + chunkSize]
+                args = (block, start, plan, n, labels, tabs)
+                return worker, args, executor.submit(worker, *args)
+
+            chunks = _chunks(matr, array, chunkSize, shm)
+            pending = deque(submit(chunk) for chunk in itertools.islice(chunks, 2*workers))
+            state = list(plan)  # the plan after the chunks yielded so far
+            fallenBefore = set()
+            while len(pending) != 0:
+                worker, args, future = pending.popleft()
+                for chunk in itertools.islice(chunks, 1): # keep at most 2*workers chunks in memory
+                    pending.append(submit(chunk))
+                try:
+                    text, used, fallen = future.result()
+                    again = len(used & fallenBefore) != 0
+                except Exception:
+                    again = True
+                if again:
+                    block, start, _, _, labels, _ = args
+                    text, used, fallen = worker(block, start, list(state), n, labels, tabs)
+                for j in fallen:
+                    state[j] = fallbackFormat(state[j])
+                fallenBefore |= fallen
+                yield text
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
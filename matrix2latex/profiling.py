@@ -0,0 +1,101 @@
+"""This file is part of matrix2latex.
+
+matrix2latex is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+matrix2latex is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with matrix2latex. If not, see <http://www.gnu.org/licenses/>.
+"""
+# Wall time and call counts per phase of matrix2latex and render.matrix2image,
+# see the profile keyword. Nothing is recorded, and nothing is timed, without a profile.
+import copy
+import time
+from collections import OrderedDict
+
+try:
+    clock = time.perf_counter   # python >= 3.3
+except AttributeError:
+    clock = time.time
+
+class Profile(object):
+    r'''
+    Wall time and number of calls of each phase, for one or more calls to matrix2latex
+    (or Renderer.render, render.matrix2image) given ``profile=profile``::
+
+        profile = Profile()
+        matrix2latex(m, 'table', profile=profile)
+        print(profile)
+
+    The phases of matrix2latex are keywords (checking and compiling them), cache, convert
+    (pandas, numpy and .npy input to rows), dimensions (the column count and transpose), plan
+    (alignment and formats), format (headers and values, including fix) and write (to the string and file).
+    fix is also timed on its own, as part of format. matrix2image adds template, compile, copy and cleanup.
+    The tables, rows and cells rendered and the bytes (utf-8) written are counted.
+    '''
+    def __init__(self):
+        self.phases = OrderedDict()     # phase: [calls, seconds]
+        self.tables = 0
+        self.rows = 0
+        self.cells = 0
+        self.bytes = 0
+        self.last = None
+
+    def add(self, phase, seconds, calls=1):
+        """Adds seconds and calls to phase"""
+        try:
+            entry = self.phases[phase]
+        except KeyError:
+            entry = self.phases[phase] = [0, 0.]
+        entry[0] += calls
+        entry[1] += seconds
+
+    def start(self):
+        """Starts timing the next phase, see lap"""
+        self.last = clock()
+
+    def lap(self, phase):
+        """Adds the time since start (or the previous lap) to phase"""
+        now = clock()
+        self.add(phase, now - self.last)
+        self.last = now
+
+    def timed(self, phase, function):
+        """function, with its calls and time added to phase"""
+        def timedFunction(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(phase, clock() - start)
+        return timedFunction
+
+    def timedPlan(self, plan):
+        """Copy of the column formats plan (see formatting.formatPlan) with fix timed"""
+        timedPlan = list()
+        for columnFormat in plan:
+            if getattr(columnFormat, 'needsFix', False):
+                columnFormat = copy.copy(columnFormat)
+                columnFormat.fix = self.timed('fix', columnFormat.fix)
+                columnFormat.fixMany = self.timed('fix', columnFormat.fixMany)
+            timedPlan.append(columnFormat)
+        return timedPlan
+
+    def stats(self):
+        """Dictionary with the calls and seconds of each phase, and the tables, rows, cells and bytes"""
+        return dict(phases=OrderedDict((phase, dict(calls=calls, seconds=seconds))
+                                       for phase, (calls, seconds) in self.phases.items()),
+                    tables=self.tables, rows=self.rows, cells=self.cells, bytes=self.bytes)
+
+    def __str__(self):
+        lines = ['%-12s %10s %12s' % ('phase', 'calls', 'seconds')]
+        for phase, (calls, seconds) in self.phases.items():
+            lines.append('%-12s %10d %12.6f' % (phase, calls, seconds))
+        lines.append('%d tables, %d rows, %d cells, %d bytes' % (self.tables, self.rows, self.cells, self.bytes))
+        return '\n'.join(lines)
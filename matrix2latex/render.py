@@ -14,13 +14,43 @@ You should have received a copy of the GNU General Public License
 along with matrix2latex. If not, see <http://www.gnu.org/licenses/>.
 """
 import os
+import re
 import shutil
+import hashlib
 import warnings
 import tempfile
 import subprocess
-from matrix2latex import matrix2latex
+from .matrix2latex import matrix2latex
+from .diskcache import DiskCache
+from . import metrics
+from .profiling import clock
+
+try:
+    _hash = hashlib.blake2b     # python >= 3.6
+except AttributeError:
+    _hash = hashlib.sha1
+
+class Rendered(tuple):
+    """The ``(working_dir, latex)`` tuple returned by matrix2image,
+    cached is True if the image was taken from the cache instead of being compiled.
+    With ``in_memory=True``, pdf, png and log are the bytes of the files made by tex (None if missing)."""
+    def __new__(cls, working_dir, latex, cached=False, pdf=None, png=None, log=None):
+        self = tuple.__new__(cls, (working_dir, latex))
+        self.cached = cached
+        self.pdf = pdf
+        self.png = png
+        self.log = log
+        return self
+
+    def __reduce__(self): # for pickle and copy, tuple's would lose the attributes
+        return (Rendered, (self.working_dir, self.latex, self.cached, self.pdf, self.png, self.log))
+
+    working_dir = property(lambda self: self[0])
+    latex = property(lambda self: self[1])
 
 _latex_documentclass = r'\documentclass[varwidth=true, border=2pt, convert=true]{standalone}'
+# one page per standalone environment, for matrix2images
+_latex_documentclass_multi = r'\documentclass[varwidth=true, border=2pt, multi=true]{standalone}'
 _latex_preamble = r"""\providecommand{\e}[1]{\ensuremath{\times 10^{#1}}}
 \usepackage{amsmath}
 \usepackage{booktabs}
@@ -32,6 +62,222 @@ _latex_template = r"""%s
 %s
 \end{document}
 """
+def _ramDir():
+    # a directory in memory for temporary files, None (the default temporary directory) if there is none
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return None
+
+def _readOutputs(base):
+    # the bytes of base.pdf, base.png and base.log, None for missing files
+    outputs = dict()
+    for extension in ('pdf', 'png', 'log'):
+        try:
+            with open(base + '.' + extension, 'rb') as f:
+                outputs[extension] = f.read()
+        except (IOError, OSError):
+            outputs[extension] = None
+    return outputs
+
+def _noLap(phase):
+    # Profile.lap without a profile
+    pass
+
+def _imageKey(latex, tex, tex_options, output_format):
+    # the cache key of the image compiled from the document latex
+    h = _hash()
+    h.update(repr((tex, list(tex_options), output_format)).encode('utf-8'))
+    h.update(latex.encode('utf-8'))
+    return h.hexdigest()
+
+def _cacheKeyword(kwargs):
+    # the cache keyword of matrix2image, the name of a directory is replaced with its DiskCache,
+    # which is also passed on to matrix2latex
+    cache = kwargs.get('cache')
+    if isinstance(cache, str):
+        cache = kwargs['cache'] = DiskCache(cache)
+    return cache
+
+def _cachedImage(cache, latex, tex, tex_options, output_format, output_filename_final, in_memory, lap=_noLap):
+    """Looks up the image compiled from the document latex in cache, returns its key (None without a cache
+    or tex) and, if found, the Rendered result. The image is then written to output_filename_final,
+    or with in_memory returned in the result if it is a '.pdf' or '.png'."""
+    if cache is None or tex is None or tex == '':
+        return None, None
+    key = _imageKey(latex, tex, tex_options, output_format)
+    image = cache.getBytes(key)
+    (metrics.cacheMisses if image is None else metrics.cacheHits).inc()
+    lap('cache')
+    if image is None:
+        return key, None
+    if in_memory and output_format in ('.pdf', '.png'):
+        return key, Rendered(None, latex, cached=True, **{output_format[1:]: image})
+    with open(output_filename_final, 'wb') as f:
+        f.write(image)
+    lap('copy')
+    return key, Rendered(None, latex, cached=True)
+
+def _storeOutputs(output_filename_tmp, output_filename_final, output_format, in_memory, cache, key, lap=_noLap):
+    """Copies the compiled output_filename_tmp to output_filename_final, or with in_memory returns
+    the outputs of tex as bytes (see _readOutputs, an empty dictionary otherwise).
+    The output is stored in cache if key (from _cachedImage) is not None."""
+    outputs = dict()
+    if in_memory:
+        outputs = _readOutputs(output_filename_tmp[:-len(output_format)])
+    else:
+        shutil.copyfile(output_filename_tmp, output_filename_final)
+    lap('copy')
+    if key is not None:
+        with open(output_filename_tmp, 'rb') as f:
+            cache.putBytes(key, f.read())
+        lap('cache')
+    return outputs
+
+def _texCommand(tex, tex_options, tex_filename, fmt=None):
+    # the command compiling tex_filename, with the format fmt if given
+    cmd = [tex]
+    if fmt is not None:
+        cmd.append('-fmt=' + fmt)
+    cmd.extend(tex_options)
+    cmd.append(tex_filename)
+    return cmd
+
+def _checkOutput(output_filename_tmp, cmd):
+    # raises IOError, counted as a failed compile, if tex did not make output_filename_tmp
+    if not(os.path.exists(output_filename_tmp)):
+        metrics.compileFailures.inc()
+        raise IOError('Expected %s to exist after calling %s' % (output_filename_tmp, cmd))
+
+def _workingDir(working_dir, clean_latex, in_memory=False):
+    """Creates working_dir (a temporary directory if None, in memory if possible with in_memory),
+    returns it and the files in it that should not be cleaned, None for a temporary directory"""
+    # in the case of working_dir=existing directory and clean_latex=True, keep a list of files that should not be cleaned
+    existing_files = []
+    if working_dir is None:
+        working_dir = tempfile.mkdtemp(prefix='matrix2image', dir=_ramDir() if in_memory else None)
+        existing_files = None
+    elif not os.path.exists(working_dir):
+        os.makedirs(working_dir)
+    else:
+        if clean_latex:
+            warnings.warn('The working directory already exists and clean_latex is True, I will try not to delete any of the files currently in working_dir=%s, but I make no promises.' % working_dir)
+            # Note: there is a razy condition here, any files generated after this point will be deleted,
+            # but at least we are not deleting family photos...
+            # An alternative would be to clean only files known to be generated by pdflatex,
+            # but odd tex compilers and packages can create odd files.
+            existing_files = os.listdir(working_dir)
+    return working_dir, existing_files
+
+_failed_formats = set()          # formats that could not be dumped, not tried again
+
+def _format(format_dir, tex, latex_documentclass, latex_preamble):
+    """
+    The precompiled format of the documentclass and preamble for tex, dumped with the mylatexformat package
+    in format_dir the first time, named by a hash of tex and the preamble.
+    Returns the path of the format (without .fmt), None if it could not be dumped.
+    """
+    h = _hash()
+    h.update(repr((tex, latex_documentclass, latex_preamble)).encode('utf-8'))
+    name = 'matrix2image-%s' % h.hexdigest()[:32]
+    path = os.path.join(os.path.abspath(format_dir), name)
+    if path in _failed_formats:
+        return None
+    if os.path.exists(path + '.fmt'):
+        return path
+    if not os.path.exists(format_dir):
+        os.makedirs(format_dir)
+    tmp = tempfile.mkdtemp(prefix='.matrix2image', dir=format_dir)
+    try:
+        with open(os.path.join(tmp, 'preamble.tex'), 'w') as f:
+            f.write('%s\n%s\n\\begin{document}\n\\end{document}\n' % (latex_documentclass, latex_preamble))
+        cmd = [tex, '-ini', '-interaction=nonstopmode', '-jobname=' + name,
+               '&' + os.path.basename(tex), 'mylatexformat.ltx', 'preamble.tex']
+        try:
+            subprocess.check_call(cmd, cwd=tmp)
+            os.rename(os.path.join(tmp, name + '.fmt'), path + '.fmt') # atomic, for concurrent processes
+        except (OSError, subprocess.CalledProcessError): # no mylatexformat, a tex without -ini, ...
+            if not os.path.exists(path + '.fmt'):
+                _failed_formats.add(path)
+                return None
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return path
+
+def _badFormat(path):
+    # the format at path (from _format) failed where compiling without it worked, e.g. dumped by another
+    # version of tex: it is removed and not dumped again by this process
+    _failed_formats.add(path)
+    try:
+        os.remove(path + '.fmt')
+    except OSError:
+        pass
+
+def _tex(cmd, cwd, withFormat=False):
+    # subprocess.check_call of a tex command, timed and counted in the metrics
+    # withFormat: a compile with -fmt, when it fails the caller compiles again without the format,
+    # the failed call is then only counted as a format fallback
+    start = clock()
+    observe = True
+    try:
+        subprocess.check_call(cmd, cwd=cwd)
+    except subprocess.CalledProcessError:
+        if withFormat:
+            observe = False
+            metrics.formatFallbacks.inc()
+        else:
+            metrics.compileFailures.inc()
+        raise
+    except OSError:
+        metrics.compileFailures.inc()
+        raise
+    finally:
+        if observe:
+            metrics.compileSeconds.observe(clock() - start)
+
+def _compile(latex, tex_filename, working_dir, tex, tex_options, output_filename_tmp, fmt=None):
+    """Writes the document latex to tex_filename in working_dir and compiles it with tex,
+    with the format fmt if given (falling back to compiling without it, see _badFormat),
+    returns False if tex is None or empty (not compiled)"""
+    with open(os.path.join(working_dir, tex_filename), 'w') as f:
+        f.write(latex)
+    
+    if tex is None or tex == '':
+        return False
+    cmd = _texCommand(tex, tex_options, tex_filename)
+    if fmt is None:
+        _tex(cmd, working_dir)
+    else:
+        try:
+            _tex(_texCommand(tex, tex_options, tex_filename, fmt), working_dir, withFormat=True)
+        except subprocess.CalledProcessError:
+            _tex(cmd, working_dir)  # raises if the document itself fails, the format is then kept
+            _badFormat(fmt)
+
+    # we should now have a output_filename in the working directory
+    _checkOutput(output_filename_tmp, cmd)
+    return True
+
+def _clean(working_dir, existing_files):
+    """Removes the files in working_dir that are not in existing_files, and working_dir if it is then empty,
+    returns working_dir or None if removed"""
+    if existing_files is None:  # our temporary directory
+        shutil.rmtree(working_dir)
+        return None
+    # only remove related files, then check if empty, then remove
+    for p in os.listdir(working_dir):
+        if p not in existing_files:
+            try:
+                os.remove(os.path.join(working_dir, p)) # raises OSError if p is a directory, which is unexpected.
+            except OSError as e:
+                raise OSError('Trouble removing file/directory:"%s", not cleaning. %s' % (p,e))
+
+    # if empty:
+    if len(os.listdir(working_dir)) == 0:
+        shutil.rmtree(working_dir)
+        return None # do not return path to non-existing directory
+    warnings.warn('working_dir not empty, not cleaning %s' % working_dir)
+    return working_dir
+
 def matrix2image(matr, filename=None, *args, **kwargs):
     r'''
     A wrapper around ``matrix2latex(*args, **kwargs)`` that creates a minimal LaTeX document code,
@@ -64,6 +310,23 @@ def matrix2image(matr, filename=None, *args, **kwargs):
         If empty string or None, the document is not compiled.
     :key tex_options=['-interaction=nonstopmode', '-shell-escape']:
         Options passed to tex renderer
+    :key cache=None:
+        A DiskCache or the name of its directory, the compiled image is taken from the cache if the same document
+        was compiled with the same tex, tex_options and output_format before, and tex is then not called.
+        The table is also cached, see the cache keyword of matrix2latex.
+        A RenderCache keeps the images in memory, for compiling the same table once in a process.
+    :key format_dir=None:
+        A directory for precompiled formats of the documentclass and preamble, made with
+        ``tex -ini`` and the mylatexformat package the first time a preamble is used,
+        later documents with the same preamble are compiled with ``-fmt`` without loading the packages again.
+        If the format can not be made, or compiling with it fails, the document is compiled as usual.
+    :key in_memory=False:
+        Return the '.pdf', '.png' and '.log' made by tex as bytes in the pdf, png and log attributes
+        of the result instead of copying the output to filename, filename is only used to name the document.
+        Without a working_dir, the document is compiled in ``/dev/shm`` if it exists.
+    :key profile=None:
+        A Profile, the phases of matrix2latex are added to it (see the profile keyword of matrix2latex)
+        and those of matrix2image: template, cache, compile (including making the format), copy and cleanup.
     :key output_format='.pdf':
         By default it is assumed ``tex='pdflatex'`` produces a '.pdf' and a '.png', 
         by default the '.pdf' is used, but you may also want to use ``output_format='.png'`` for the png image.
@@ -74,6 +337,8 @@ def matrix2image(matr, filename=None, *args, **kwargs):
     :returns working_dir, latex:
         A tuple of the working_dir and the latex document as a string. 
         The working_dir is None if the directory has been succesfully cleaned/removed.
+        The tuple has a ``cached`` attribute, True if the image was taken from the cache,
+        and ``pdf``, ``png`` and ``log`` attributes, see ``in_memory``.
 
     :raises IOError: if the expected output file was not created.
     :raises IOError: if removing files/directories in working_dir fails, this _will_ happend if working_dir suddenly contains folders.
@@ -89,75 +354,175 @@ def matrix2image(matr, filename=None, *args, **kwargs):
     if filename.endswith(('.pdf', '.tex', '.png')):
         filename = filename[:-4]
 
-    clean_latex = kwargs.pop('clean_latex', True)
-    working_dir = kwargs.pop('working_dir', None)
-    # in the case of working_dir=existing directory and clean_latex=True, keep a list of files that should not be cleaned
-    existing_files = []
-    if working_dir is None:
-        working_dir = tempfile.mkdtemp(prefix='matrix2image')
-    elif not os.path.exists(working_dir):
-        os.makedirs(working_dir)
-    else:
-        if clean_latex:
-            warnings.warn('The working directory already exists and clean_latex is True, I will try not to delete any of the files currently in working_dir=%s, but I make no promises.' % working_dir)
-            # Note: there is a razy condition here, any files generated after this point will be deleted,
-            # but at least we are not deleting family photos...
-            # An alternative would be to clean only files known to be generated by pdflatex,
-            # but odd tex compilers and packages can create odd files.
-            existing_files = os.listdir(working_dir)
-
     latex_template = kwargs.pop('latex_template', _latex_template)
     latex_preamble = kwargs.pop('latex_preamble', _latex_preamble)
     latex_documentclass = kwargs.pop('latex_documentclass', _latex_documentclass)
     tex = kwargs.pop('tex', 'pdflatex')
     tex_options = kwargs.pop('tex_options', ['-interaction=nonstopmode', '-shell-escape'])
     output_format = kwargs.pop('output_format', '.pdf')
+    clean_latex = kwargs.pop('clean_latex', True)
+    working_dir = kwargs.pop('working_dir', None)
+    format_dir = kwargs.pop('format_dir', None)
+    in_memory = kwargs.pop('in_memory', False)
+    cache = _cacheKeyword(kwargs)   # also passed on to matrix2latex
+    profile = kwargs.get('profile') # likewise
 
-    # filenames
-    tex_filename = os.path.basename(filename) + '.tex'
-    tex_filename_full = os.path.join(working_dir, tex_filename)
     output_filename_final = filename + output_format
-    output_filename_tmp = os.path.join(working_dir, os.path.basename(filename) + output_format)
     
     # call, do not write to file but get the latex-table as a string
     table = matrix2latex(matr, None, *args, **kwargs)
+    lap = _noLap
+    if profile is not None:
+        profile.start()
+        lap = profile.lap
     
     # latex document
     latex = latex_template % (latex_documentclass, latex_preamble, table)
-    with open(tex_filename_full, 'w') as f:
-        f.write(latex)
-    
+    lap('template')
+
+    # the compiled document from an earlier call, no need for a working_dir
+    key, cached = _cachedImage(cache, latex, tex, tex_options, output_format, output_filename_final, in_memory, lap)
+    if cached is not None:
+        return cached
+
+    working_dir, existing_files = _workingDir(working_dir, clean_latex, in_memory)
+
+    # filenames
+    tex_filename = os.path.basename(filename) + '.tex'
+    output_filename_tmp = os.path.join(working_dir, os.path.basename(filename) + output_format)
+
     # compile document
-    if tex is not None and tex != '': # I am sure there is a sexy way to write this test
-        cmd = [tex]
-        cmd.extend(tex_options)
-        cmd.append(tex_filename)
-        subprocess.check_call(cmd, cwd=working_dir)
+    fmt = None
+    if format_dir is not None and tex is not None and tex != '':
+        fmt = _format(format_dir, tex, latex_documentclass, latex_preamble)
+    outputs = dict()
+    compiled = _compile(latex, tex_filename, working_dir, tex, tex_options, output_filename_tmp, fmt)
+    lap('compile')
+    if compiled:
+        outputs = _storeOutputs(output_filename_tmp, output_filename_final, output_format, in_memory, cache, key, lap)
+
+    if clean_latex:
+        working_dir = _clean(working_dir, existing_files)
+        lap('cleanup')
     
-        # we should now have a output_filename in the working directory
-        if not(os.path.exists(output_filename_tmp)):
-            raise IOError('Expected %s to exist after calling %s' % (output_filename_tmp, cmd))
+    return Rendered(working_dir, latex, **outputs)
 
-        print(output_filename_tmp, output_filename_final)
-        shutil.copyfile(output_filename_tmp, output_filename_final)
+def matrix2images(jobs, **kwargs):
+    r'''
+    Like matrix2image for many tables, with a single call to tex: the tables are the pages of one
+    standalone document (the ``multi`` option, a page per ``standalone`` environment),
+    the pdf is then split in one file per table, or converted to one png per table::
 
-    if clean_latex:
-        # only remove related files, then check if empty, then remove
-        for p in os.listdir(working_dir):
-            if p not in existing_files:
-                try:
-                    os.remove(os.path.join(working_dir, p)) # raises OSError if p is a directory, which is unexpected.
-                except OSError as e:
-                    raise OSError('Trouble removing file/directory:"%s", not cleaning. %s' % (p,e))
-
-        # if empty:
-        if len(os.listdir(working_dir)) == 0:
-            shutil.rmtree(working_dir)
-            working_dir = None # do not return path to non-existing directory
+        matrix2images([(m1, 'table1'), (m2, 'table2', dict(caption='Two'))], output_format='.png')
+
+    :param list jobs:
+        Tables as ``(matr, filename)`` or ``(matr, filename, options)`` tuples, as for render_many.
+        The table is written to filename + output_format as by matrix2image,
+        options are keyword-arguments to matrix2latex for this table.
+    :key latex_documentclass:
+        Defaults to ``render._latex_documentclass_multi``, must give a page for each ``standalone`` environment.
+    :key output_format='.pdf':
+        '.pdf' splits the pages with pdfseparate, '.png' converts them with pdftoppm.
+    :key pdfseparate='pdfseparate':
+        Command splitting the pdf in pages, called as ``pdfseparate document.pdf page-%d.pdf``.
+    :key pdftoppm='pdftoppm':
+        Command converting the pdf to png, called as ``pdftoppm -png [pdftoppm_options] document.pdf page``.
+    :key pdftoppm_options=['-r', '300']:
+        Options passed to pdftoppm.
+    :key clean_latex, working_dir, latex_preamble, latex_template, tex, tex_options, format_dir:
+        As for matrix2image, the tex compiler must produce a '.pdf'.
+    :key cache=None:
+        A RenderCache, DiskCache or the name of its directory, for the tables (see the cache keyword
+        of matrix2latex). The document is always compiled, the pages are not cached.
+    :key profile=None:
+        A Profile, as for matrix2image, with the phases template, compile (including splitting the pages),
+        copy and cleanup.
+    :\**kwargs:
+        Additional keyword-arguments are passed to matrix2latex for all tables.
+    :returns working_dir, latex:
+        As for matrix2image, latex is the document with all the tables.
+
+    :raises IOError: if the expected output file, or a page, was not created.
+    :raises subprocess.CalledProcessError: if the call to tex, pdfseparate or pdftoppm indicates a failure.
+    :raises ValueError: if output_format is not '.pdf' or '.png', or if in_memory is given.
+    '''
+    latex_template = kwargs.pop('latex_template', _latex_template)
+    latex_preamble = kwargs.pop('latex_preamble', _latex_preamble)
+    latex_documentclass = kwargs.pop('latex_documentclass', _latex_documentclass_multi)
+    tex = kwargs.pop('tex', 'pdflatex')
+    tex_options = kwargs.pop('tex_options', ['-interaction=nonstopmode', '-shell-escape'])
+    output_format = kwargs.pop('output_format', '.pdf')
+    pdfseparate = kwargs.pop('pdfseparate', 'pdfseparate')
+    pdftoppm = kwargs.pop('pdftoppm', 'pdftoppm')
+    pdftoppm_options = kwargs.pop('pdftoppm_options', ['-r', '300'])
+    clean_latex = kwargs.pop('clean_latex', True)
+    working_dir = kwargs.pop('working_dir', None)
+    format_dir = kwargs.pop('format_dir', None)
+    if output_format not in ('.pdf', '.png'):
+        raise ValueError("Error: output_format must be '.pdf' or '.png', got '%s'" % output_format)
+    if 'in_memory' in kwargs:
+        raise ValueError('Error: in_memory is not supported, the pages are written to their files')
+    _cacheKeyword(kwargs)           # passed on to matrix2latex
+    profile = kwargs.get('profile') # likewise
+
+    filenames = list()
+    tables = list()
+    for job in jobs:
+        if len(job) == 2:
+            matr, filename = job
+            options = dict()
         else:
-            warnings.warn('working_dir not empty, not cleaning %s' % working_dir)
-    
-    return working_dir, latex
+            matr, filename, options = job
+        if filename is None:
+            filename = 'rendered'
+        if filename.endswith(('.pdf', '.tex', '.png')):
+            filename = filename[:-4]
+        filenames.append(filename)
+        tables.append(matrix2latex(matr, None, **dict(kwargs, **options)))
+
+    lap = _noLap
+    if profile is not None:
+        profile.start()
+        lap = profile.lap
+
+    # latex document, a page per table
+    body = '\n'.join('\\begin{standalone}\n%s\n\\end{standalone}' % table for table in tables)
+    latex = latex_template % (latex_documentclass, latex_preamble, body)
+    lap('template')
+
+    fmt = None
+    if format_dir is not None and tex is not None and tex != '':
+        fmt = _format(format_dir, tex, latex_documentclass, latex_preamble)
+    working_dir, existing_files = _workingDir(working_dir, clean_latex)
+    if _compile(latex, 'matrix2images.tex', working_dir, tex, tex_options,
+                os.path.join(working_dir, 'matrix2images.pdf'), fmt):
+        # pages, page-1.pdf, page-2.pdf, ... (pdftoppm pads the numbers with zeros)
+        if output_format == '.png':
+            cmd = [pdftoppm, '-png']
+            cmd.extend(pdftoppm_options)
+            cmd.extend(['matrix2images.pdf', 'page'])
+        else:
+            cmd = [pdfseparate, 'matrix2images.pdf', 'page-%d.pdf']
+        subprocess.check_call(cmd, cwd=working_dir)
+        pattern = re.compile(r'page-0*(\d+)' + re.escape(output_format) + '$')
+        pages = dict()
+        for p in os.listdir(working_dir):
+            match = pattern.match(p)
+            if match is not None:
+                pages[int(match.group(1))] = os.path.join(working_dir, p)
+        lap('compile')
+
+        for page, filename in enumerate(filenames, 1):
+            if page not in pages:
+                raise IOError('Expected page %d for %s to exist after calling %s' % (page, filename, cmd))
+            shutil.copyfile(pages[page], filename + output_format)
+        lap('copy')
+
+    if clean_latex:
+        working_dir = _clean(working_dir, existing_files)
+        lap('cleanup')
+
+    return Rendered(working_dir, latex)
 
 if __name__ == '__main__':
     # m = [[1, 2, 3], [3, 4, 5]]
@@ -0,0 +1,230 @@
+"""This file is part of matrix2latex.
+
+matrix2latex is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+matrix2latex is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with matrix2latex. If not, see <http://www.gnu.org/licenses/>.
+"""
+# Column-wise formatting of numpy arrays and pandas DataFrames, gives the same output as the
+# per element loop in matrix2latex, but without the per element float(), isnan and inf tests.
+import mmap
+np = None                       # numpy is optional, imported by _importNumpy when needed
+_numpyMissing = False
+
+def _importNumpy():
+    # importing numpy takes longer than the rest of matrix2latex,
+    # only import it for input that may be an array
+    global np, _numpyMissing
+    if np is None and not _numpyMissing:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            _numpyMissing = True
+    return np is not None
+
+from .formatting import NotNumeric, fallbackFormat
+
+def loadArray(matr):
+    """
+    input: anything
+    output: a read-only numpy memmap if matr is the path of a .npy file, otherwise matr
+    """
+    if isinstance(matr, str) and matr.endswith('.npy') and _importNumpy():
+        return np.load(matr, mmap_mode='r')
+    return matr
+
+def mappedFile(arr):
+    """
+    input: numpy array
+    output: the mmap.mmap behind arr if arr is (a view of) a read-only numpy memmap, otherwise None
+    """
+    while arr is not None:
+        mm = getattr(arr, '_mmap', None)
+        if mm is not None:
+            if getattr(arr, 'mode', None) == 'r':
+                return mm
+            return None         # writable, leave it alone
+        arr = getattr(arr, 'base', None)
+    return None
+
+def asNumericArray(matr):
+    """
+    input: numpy array/matrix (or anything with a dtype, like a pandas Series)
+    output: 2 dimensional numpy array or None
+    returns None if matr is not a non-empty array of booleans, integers or floats
+    with 1 or 2 dimensions. A vector is returned as a single column.
+    """
+    if not hasattr(matr, 'dtype') or not _importNumpy():
+        return None
+    try:
+        arr = np.asarray(matr)  # no copy, also turns numpy.matrix into a plain array
+    except (TypeError, ValueError):
+        return None
+    if arr.dtype.kind not in 'biuf' or arr.ndim not in (1, 2) or arr.size == 0:
+        return None
+    if arr.ndim == 1:           # vector
+        arr = arr.reshape(-1, 1)
+    return arr
+
+def formatArrayColumn(col, columnFormat):
+    r"""
+    input: 1 dimensional numeric numpy array col, column format from formatting.formatPlan
+    output: list of strings, one per element
+    Uses the same rules as matrix2latex: nan gives {-}, +-inf gives $\pm\infty$,
+    the rest is formatted with the column format and 1e+2 is replaced with 1\e{+02}.
+    """
+    if columnFormat.render is None: # no format for this column
+        return ['{-}']*len(col)
+
+    if columnFormat.numeric:
+        values = col.astype(np.float64, copy=False)
+    else:
+        values = col            # as is, integers are printed as integers
+
+    special = None
+    if col.dtype.kind == 'f':
+        nan = np.isnan(col)
+        posinf = col == np.inf
+        neginf = col == -np.inf
+        special = nan | posinf | neginf
+        if not special.any():
+            special = None
+        else:
+            values = values[~special]
+
+    cells = list(map(columnFormat.render, values.tolist()))
+    if columnFormat.needsFix:
+        cells = columnFormat.fixMany(cells, table=True) # fix 1e+2
+
+    if special is None:
+        return cells
+    out = np.empty(len(col), dtype=object)
+    out[nan] = '{-}'
+    out[posinf] = r'$\infty$'
+    out[neginf] = r'$-\infty$'
+    out[~special] = np.array(cells, dtype=object)
+    return out.tolist()
+
+def asFrame(matr):
+    """
+    input: anything
+    output: matr if it is a non-empty pandas DataFrame, otherwise None
+    """
+    if not hasattr(matr, 'iloc') or not hasattr(matr, 'dtypes') or not _importNumpy():
+        return None
+    try:
+        m, n = matr.shape
+    except ValueError:          # Series
+        return None
+    if m == 0 or n == 0:
+        return None
+    return matr
+
+def frameColumns(frame):
+    """
+    input: pandas DataFrame
+    output: list of 1 dimensional numpy arrays, one per column
+    Numeric columns are not copied, dates and times are given as strings
+    and missing values (NaN, NaT, pd.NA) in all other columns as None.
+    """
+    columns = list()
+    for j in range(frame.shape[1]):
+        col = frame.iloc[:, j]
+        if getattr(col.dtype, 'kind', 'O') in 'Mm': # datetime, timedelta
+            values = np.asarray(col.astype(str), dtype=object)
+        else:
+            values = np.asarray(col)
+        if values.dtype.kind not in 'biuf':
+            missing = np.asarray(col.isna())
+            if missing.any():
+                values = np.where(missing, None, values) # copy, do not touch the frame
+        columns.append(values)
+    return columns
+
+def formatObjectColumn(col, plan, j):
+    """
+    input: 1 dimensional numpy array col, list of column formats plan, column index j
+    output: list of strings, one per element
+    Element by element, plan[j] falls back to a string format at the first element that is not a number.
+    """
+    cells = list()
+    for e in col.tolist():
+        try:
+            cells.append(plan[j](e))
+        except NotNumeric:      # can't convert to float, use string for the rest of the column
+            plan[j] = fallbackFormat(plan[j])
+            cells.append(plan[j](e))
+    return cells
+
+def formatColumnsRows(columns, plan, blockSize=1024, release=None):
+    """
+    input: list of 1 dimensional numpy arrays of equal length, list of column formats from formatting.formatPlan
+    output: generator of rows (tuples) of formatted cells
+    The columns are formatted in blocks of blockSize rows,
+    numeric columns with formatArrayColumn and the rest with formatObjectColumn.
+    If given, release(start, stop) is called after the rows start:stop are formatted, before they are yielded.
+    """
+    if len(columns) == 0:
+        return
+    m = len(columns[0])
+    for start in range(0, m, blockSize):
+        cells = list()
+        for j, col in enumerate(columns):
+            block = col[start:start + blockSize]
+            if block.dtype.kind in 'biuf':
+                cells.append(formatArrayColumn(block, plan[j]))
+            else:
+                cells.append(formatObjectColumn(block, plan, j))
+        if release is not None:
+            release(start, min(start + blockSize, m))
+        for row in zip(*cells):
+            yield row
+
+def _byteBounds(arr):
+    # addresses of the first byte and one past the last byte of the memory used by numpy array arr
+    low = high = arr.__array_interface__['data'][0]
+    for n, stride in zip(arr.shape, arr.strides):
+        if n == 0:
+            return low, low
+        if stride < 0:
+            low += (n - 1)*stride
+        else:
+            high += (n - 1)*stride
+    return low, high + arr.itemsize
+
+def pageRange(arr, base, start, stop):
+    """
+    input: numpy array arr in a memory map starting at address base, rows start:stop of arr
+    output: offset (a multiple of mmap.PAGESIZE) and length of the part of the map holding these rows
+    """
+    low, high = _byteBounds(arr[start:stop])
+    offset = low - base
+    offset -= offset % mmap.PAGESIZE
+    return offset, high - base - offset
+
+def formatArrayRows(arr, plan, blockSize=1024):
+    """
+    input: 2 dimensional numeric numpy array arr, list of column formats from formatting.formatPlan
+    output: generator of rows (tuples) of formatted cells
+    The array is formatted column-wise in blocks of blockSize rows.
+    For a read-only memmap (see loadArray) the pages of a block are released before the next block
+    (only those, see pageRange), so only about one block of the file is resident at a time.
+    """
+    release = None
+    mm = mappedFile(arr)
+    if mm is not None and hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_DONTNEED'): # python >= 3.8, unix
+        base = np.frombuffer(mm, dtype=np.uint8).__array_interface__['data'][0]
+        def release(start, stop):
+            offset, length = pageRange(arr, base, start, stop)
+            if length > 0:
+                mm.madvise(mmap.MADV_DONTNEED, offset, length)
+    return formatColumnsRows([arr[:, j] for j in range(arr.shape[1])], plan, blockSize, release)
@@ -20,12 +20,16 @@ import os
 import sys
 
 sys.path.insert(0, '../')
-from matrix2latex import matrix2latex
+from matrix2latex import matrix2latex, iter_latex, render_many, Renderer, RenderCache, DiskCache, Profile, metrics
 
 try:
     from test_syntaxError import *
 except SyntaxError:
     pass
+try:
+    from test_async import *
+except SyntaxError:
+    pass
 
 from test_util import *
 
@@ -45,6 +49,20 @@ def test_transpose2():
     t = matrix2latex(m, transpose=True, headerRow=cl)
     assertEqual(t, "transpose2")
 
+def test_transpose3():
+    t = matrix2latex(m, transpose=False)
+    assertEqual(t, "simple")
+    t = matrix2latex([[1, 4, 7], [2, 5], [3, 6]], transpose=True) # like zip, the shortest row is used
+    assertEqual(t, "simple")
+    try:
+        import numpy as np
+        import pandas as pd
+    except ImportError:
+        return
+    for a in (np.array(m), pd.DataFrame(m), pd.DataFrame({'a': [1, 4], 'b': [2., 5.], 'c': [3, 6]})):
+        t = matrix2latex(a, transpose=True)
+        assertEqual(t, "transpose1")
+
 def test_file():
     matrix2latex(m, 'tmp.tex')
     f = open('tmp.tex')
@@ -135,10 +153,47 @@ def test_numpy():
     except (ImportError, AttributeError):
         pass
 
+def test_numpy_vectorized():
+    # numeric arrays are formatted column-wise, compare with the nested list equivalent
+    try:
+        import numpy as np
+    except ImportError:
+        return
+    a = np.array([[123456e-10, np.nan, 1], [-np.inf, 1e-15, 2], [12345e5, np.inf, -3]])
+    arrays = (a, a.astype(np.float32), a[:, 0], np.array([[1, 2], [3, 4]]),
+              np.array([[True, False]]), np.array([[2**62, -1]]))
+    keywords = (dict(), dict(format='%s'), dict(format='$%d$'), dict(format='$%.4g$'),
+                dict(formatColumn=['%s', '$%.1e$']), dict(transpose=True),
+                dict(headerColumn=['a'], headerRow=['b', 'c']))
+    for arr in arrays:
+        for k in keywords:
+            t = matrix2latex(arr, **k)
+            assert t == matrix2latex(arr.tolist(), **k), (arr, k, t)
+
 def test_string():
     t = matrix2latex([['a', 'b', '1'], ['1', '2', '3']], format='%s')
     assertEqual(t, "string")
 
+def test_strformat():
+    t = matrix2latex(m, None, "align*", "pmatrix", format="${:.2f}$", alignment='c')
+    assertEqual(t, "alignment_withoutTable")
+    t = matrix2latex([['a', 'b', '1'], ['1', '2', '3']], format='{}')
+    assertEqual(t, "string")
+    t = matrix2latex([123456e-10, 1e-15, 12345e5], format='${:.4g}$')
+    assertEqual(t, 'nicefloat_4g')
+    t = matrix2latex([[1, 2.0, None], ['a', 254, 65]], formatColumn=['${:d}$', '{:#x}', '{:c}'])
+    rows = [line.strip() for line in t.split('\n')[4:6]]
+    assert rows == [r'$1$ & 0x2 & {-}\\', r'a & 0xfe & A\\'], rows
+
+def test_formatColumn_fallback():
+    # a column switches to %s at the first element that is not a number,
+    # without modifying the formatColumn given
+    formatColumn = ['$%.1f$', '$%g$']
+    t = matrix2latex([[1, 1], ['a', 2], [3, 3]], formatColumn=formatColumn)
+    assert formatColumn == ['$%.1f$', '$%g$'], formatColumn
+    rows = [line.strip() for line in t.split('\n')[4:7]]
+    assert rows == [r'$1.0$ & $1$\\', r'a & $2$\\', r'3 & $3$\\'], rows
+
 def test_none():
     m = [[1,None,None], [2,2,1], [2,1,2]]
     t = matrix2latex(m)
@@ -240,6 +295,679 @@ def test_pandas_columns():
     except ImportError:
         pass
 
+def test_generator():
+    t = matrix2latex(row for row in m)
+    assertEqual(t, "simple")
+
+def test_generator_labels():
+    cl = ["a", "b"]
+    rl = ["c", "d", "e"]
+    t = matrix2latex(iter(m), None, headerColumn=cl, headerRow=rl)
+    assertEqual(t, "labels1")
+
+def test_generator_vector():
+    t = matrix2latex(e for e in [123456e-10, 1e-15, 12345e5])
+    assertEqual(t, 'nicefloat')
+
+def test_generator_empty():
+    t = matrix2latex(iter([]))
+    assertEqual(t, 'empty')
+
+def test_generator_columns():
+    rows = [[1,2], [1, 2, 3], [5]]
+    t = matrix2latex(iter(rows), columns=3)
+    assertEqual(t, 'non_rectangular')
+    t = matrix2latex(rows, columns=3)
+    assertEqual(t, 'non_rectangular')
+    try:
+        matrix2latex(iter(rows))    # second row is longer than the first
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('expected ValueError')
+
+def test_generator_transpose():
+    t = matrix2latex(iter(m), transpose=True)
+    assertEqual(t, "transpose1")
+
+def test_iter_latex():
+    cl = ["a", "b"]
+    rl = ["c", "d", "e"]
+    chunks = list(iter_latex(m, headerColumn=cl, headerRow=rl))
+    # begin block, header row, midrule, 2 rows and end block
+    assert len(chunks) == 6, chunks
+    assert chunks[3].strip() == r"{a} & $1$ & $2$ & $3$\\", chunks[3]
+    assert ''.join(chunks) == matrix2latex(m, None, headerColumn=cl, headerRow=rl)
+
+def test_iter_latex_environments():
+    t = ''.join(iter_latex(m, "align*", "pmatrix", format="$%.2f$", alignment='c'))
+    assertEqual(t, "alignment_withoutTable")
+    # filename only gives the label, no file is written
+    t = ''.join(iter_latex(m, filename='tmp_iter_latex'))
+    assert r'\label{tab:tmp_iter_latex}' in t, t
+    assert not os.path.exists('tmp_iter_latex.tex')
+
+def test_iter_latex_error():
+    try:
+        iter_latex(m, foo='bar')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('expected ValueError')
+
+def _fixReference(s, table=False):
+    # the original (loop over re.search) implementation of fixEngineeringNotation.fix
+    import re
+    i = re.search(r'e[-+]\d\d', s)
+    while i != None:
+        before = s[0:i.start()]
+        number = s[i.start()+1:i.start()+4]
+        after = s[i.end():]
+        if table:
+            num = "%(#)+03d" % {'#': int(number)}
+        else:
+            num = "%(#)3d" % {'#': int(number)}
+
+        s = '%s\\e{%s}%s' % (before, num, after)
+        i = re.search(r'e[-+]\d\d', s)
+    return s
+
+def test_fix():
+    from matrix2latex.fixEngineeringNotation import fix, fixMany
+    cells = list()
+    for sign in '+-':
+        for exponent in range(1000):            # including three digit exponents
+            for fmt in ('%se%s%d', '%se%s%02d', '%se%s%03d', '$%se%s%02d$'):
+                cells.append(fmt % ('1.5', sign, exponent))
+    cells.extend(['', 'e', 'e+', 'e+1', 'hello', '1e+05 and 2e-07', 'e-05e+02', '1e+1e+2', 'E+05'])
+    for table in (False, True):
+        for c in cells:
+            assert fix(c, table) == _fixReference(c, table), c
+        assert fixMany(cells, table) == [_fixReference(c, table) for c in cells]
+        assert fixMany(['a\ne+05', '1e-05'], table) == [_fixReference(c, table) for c in ['a\ne+05', '1e-05']]
+    assert fixMany([]) == []
+
+def test_renderer():
+    cl = ["a", "b"]
+    rl = ["c", "d", "e"]
+    r = Renderer(headerColumn=cl, headerRow=rl)
+    for i in range(2):                  # nothing is modified by rendering
+        assertEqual(r.render(m), "labels1")
+    assert ''.join(r.iter_latex(m)) == r.render(m)
+
+    # options depending on the matrix are resolved per matrix
+    r = Renderer(alignment='r')
+    assert r.render(m) == matrix2latex(m, alignment='r')
+    assert r.render([[1, 2]]) == matrix2latex([[1, 2]], alignment='r')
+    assert Renderer(transpose=True).render(m) == matrix2latex(m, transpose=True)
+
+    r = Renderer("align*", "pmatrix", format="$%.2f$", alignment='c')
+    assertEqual(r.render(m), "alignment_withoutTable")
+
+    r.render(m, 'tmp_renderer')
+    f = open('tmp_renderer.tex')
+    content = f.read()
+    f.close()
+    os.remove('tmp_renderer.tex')
+    assertEqual(content, "alignment_withoutTable")
+
+def test_renderer_pickle():
+    import pickle
+    r = Renderer(formatColumn=['$%.2f$', '%s', '${:.1f}$'], caption="Hello", label="la")
+    r2 = pickle.loads(pickle.dumps(r))
+    assert r2.render(m) == r.render(m) == matrix2latex(m, formatColumn=['$%.2f$', '%s', '${:.1f}$'], caption="Hello", label="la")
+
+def test_renderer_error():
+    try:
+        Renderer(foo='bar')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('expected ValueError')
+
+def test_render_many():
+    jobs = [([[i, 2], [3, 4]], None, dict(caption='%d' % i)) for i in range(10)]
+    jobs.append((m, 'tmp_render_many'))
+    jobs.append((m, None, dict(foo='bar')))
+    for workers in (1, 2):
+        jobs = jobs[:12] + [(iter(m), None)] # can not be sent to a worker
+        results = render_many(jobs, workers=workers, chunksize=3)
+        assert len(results) == len(jobs)
+        for i in range(10):
+            assert results[i] == matrix2latex([[i, 2], [3, 4]], caption='%d' % i), results[i]
+        assert results[10] == matrix2latex(m, None, label='tmp_render_many'), results[10]
+        assert isinstance(results[11], ValueError), results[11]
+        assertEqual(results[12], "simple")
+        f = open('tmp_render_many.tex')
+        content = f.read()
+        f.close()
+        os.remove('tmp_render_many.tex')
+        assert content == results[10], content
+
+def test_workers():
+    # chunks formatted in worker processes, identical to formatting in this process
+    matr = [[i, 0.5*i, 'x' if i % 7 == 3 else i, None if i % 5 else 1e10] for i in range(50)]
+    matr[20][1] = 'str'         # column falls back to strings in a later chunk
+    labels = ['r%d' % i for i in range(45)]
+    for keywords in (dict(), dict(headerColumn=labels), dict(formatColumn=['%d', '${:.2f}$', '$%g$']),
+                     dict(transpose=True)):
+        expected = matrix2latex(matr, **keywords)
+        for chunkSize in (None, 1, 7, 100):
+            t = matrix2latex(matr, workers=2, chunkSize=chunkSize, **keywords)
+            assert t == expected, (keywords, chunkSize, t)
+        t = matrix2latex(iter(matr), workers=2, chunkSize=9, **keywords)
+        assert t == expected, (keywords, t)
+    try:
+        import numpy as np
+    except ImportError:
+        return
+    arr = np.arange(300.).reshape(100, 3)
+    arr[5, 1] = np.nan
+    for keywords in (dict(), dict(headerColumn=labels, format='$%.3e$'), dict(transpose=True)):
+        expected = matrix2latex(arr, **keywords)
+        t = matrix2latex(arr, workers=2, chunkSize=30, **keywords)
+        assert t == expected, (keywords, t)
+
+def test_npy():
+    # .npy files are memory mapped and formatted block by block
+    try:
+        import numpy as np
+    except ImportError:
+        return
+    arr = np.arange(3000.).reshape(1000, 3)/7
+    arr[3, 1] = np.nan
+    np.save('tmp_npy.npy', arr)
+    try:
+        expected = matrix2latex(arr, format='$%.3g$')
+        assert matrix2latex('tmp_npy.npy', format='$%.3g$') == expected
+        mapped = np.load('tmp_npy.npy', mmap_mode='r')
+        assert ''.join(iter_latex(mapped, format='$%.3g$')) == expected
+        assert matrix2latex(mapped, format='$%.3g$', transpose=True) == matrix2latex(arr.T, format='$%.3g$')
+        # only the pages of a block are released
+        from matrix2latex.vectorize import mappedFile, pageRange
+        import mmap
+        base = np.frombuffer(mappedFile(mapped), dtype=np.uint8).__array_interface__['data'][0]
+        header = mapped.__array_interface__['data'][0] - base
+        offset, length = pageRange(mapped, base, 500, 600)
+        assert offset % mmap.PAGESIZE == 0 and offset <= header + 500*24
+        assert offset + length == header + 600*24 and length < 100*24 + mmap.PAGESIZE, (offset, length)
+        del mapped
+    finally:
+        os.remove('tmp_npy.npy')
+
+def test_command_line():
+    import subprocess
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    def run(args, data):
+        p = subprocess.Popen([sys.executable, '-m', 'matrix2latex'] + args, cwd=root,
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = p.communicate(data.encode())
+        return p.returncode, out.decode(), err.decode()
+    code, out, err = run([], '1,2,3\n4,5,6\n')
+    assert code == 0, err
+    assertEqual(out[:-1], "simple")
+    code, out, err = run(['-t', '-H', '-f', '$%.2f$', '-c', 'Hello', '-l', 'la'], 'a\tb\n1\t2.5\n')
+    assert code == 0, err
+    assert out[:-1] == matrix2latex([[1, 2.5]], headerRow=['a', 'b'], format='$%.2f$',
+                                    caption='Hello', label='la'), out
+    code, out, err = run(['-e', 'align*', '-e', 'pmatrix', '-F', '%d', '-F', '%s'], '1,x\n2,\n')
+    assert code == 0, err
+    assert out[:-1] == matrix2latex([[1, 'x'], [2, None]], None, 'align*', 'pmatrix', formatColumn=['%d', '%s']), out
+    code, out, err = run([], '1,2\n1,2,3\n')
+    assert code == 1 and 'row 1' in err, err
+    code, out, err = run(['-f', 'no format'], '1,2\n')
+    assert code == 2 and 'expected a format str' in err and 'Traceback' not in err, err
+
+def test_shards():
+    matr = [[i, i**2] for i in range(10)]
+    def read(filename):
+        f = open(filename)
+        content = f.read()
+        f.close()
+        os.remove(filename)
+        return content
+    master = matrix2latex(matr, 'tmp_shards', headerRow=['a', 'b'], caption='Squares', shardRows=4)
+    assert master == '\\input{tmp_shards-001}\n\\input{tmp_shards-002}\n\\input{tmp_shards-003}\n', master
+    assert read('tmp_shards.tex') == master
+    for i, rows in enumerate((matr[:4], matr[4:8], matr[8:])):
+        if i == 0:
+            expected = matrix2latex(rows, None, headerRow=['a', 'b'], caption='Squares', label='tmp_shards')
+        else:
+            expected = matrix2latex(rows, None, headerRow=['a', 'b'])
+        assert read('tmp_shards-%03d.tex' % (i + 1)) == expected
+
+    full = matrix2latex(matr, None, 'tabular', label='tmp_shards')
+    master = matrix2latex(matr, 'tmp_shards', 'tabular', shardBytes=len(full)//2)
+    assert read('tmp_shards.tex') == master
+    shards = [read('tmp_shards-%03d.tex' % (i + 1)) for i in range(master.count('input'))]
+    assert len(shards) > 1, shards
+    assert all(len(shard) <= len(full)//2 for shard in shards)
+    body = [shard.split('\\toprule\n')[1].split('\\bottomrule')[0] for shard in shards]
+    assert ''.join(body) == full.split('\\toprule\n')[1].split('\\bottomrule')[0]
+
+    master = matrix2latex([], 'tmp_shards', shardRows=4)
+    assert master == '\\input{tmp_shards-001}\n', master
+    read('tmp_shards.tex')
+    assert read('tmp_shards-001.tex') == matrix2latex([], None, label='tmp_shards')
+    assert matrix2latex(matr, None, shardRows=4) == matrix2latex(matr)
+
+def test_cache():
+    cache = RenderCache(maxEntries=2)
+    t = matrix2latex(m, cache=cache)
+    assertEqual(t, "simple")
+    assertEqual(matrix2latex(m, cache=cache), "simple")
+    assert cache.stats() == dict(hits=1, misses=1, entries=1, bytes=len(t)), cache.stats()
+    t = matrix2latex(m, None, 'align*', 'pmatrix', cache=cache, format='%g')
+    assert t == matrix2latex(m, None, 'align*', 'pmatrix', format='%g')
+    matrix2latex([[1, '1'], [None, 1.0]], cache=cache) # evicts the least recently used
+    assert len(cache) == 2 and cache.stats()['misses'] == 3
+    assertEqual(matrix2latex(m, cache=cache), "simple")
+    assert cache.stats()['misses'] == 4
+
+    t = matrix2latex(m, 'tmp_cache', cache=cache)
+    os.remove('tmp_cache.tex')
+    assert matrix2latex(m, 'tmp_cache', cache=cache) == t
+    f = open('tmp_cache.tex')
+    assert f.read() == t        # the file is written on a hit
+    f.close()
+    os.remove('tmp_cache.tex')
+
+    assert cache.invalidate(m, 'tmp_cache')
+    assert not cache.invalidate(m, 'tmp_cache')
+    cache.clear()
+    assert cache.stats() == dict(hits=2, misses=5, entries=0, bytes=0), cache.stats()
+
+    cache = RenderCache(maxBytes=len(t))
+    matrix2latex(m, cache=cache)
+    matrix2latex(m, cache=cache, label='longer than the first')
+    assert len(cache) == 1 and cache.bytes <= len(t)
+    assert matrix2latex(iter(m), cache=cache) == matrix2latex(m) # not cached
+    assert cache.stats()['entries'] == 1
+    try:
+        import numpy as np
+    except ImportError:
+        return
+    cache = RenderCache()
+    a = np.array(m, dtype=float)
+    assertEqual(matrix2latex(a, cache=cache), "simple")
+    assertEqual(matrix2latex(a.copy(), cache=cache), "simple")
+    assertEqual(matrix2latex(np.array(m, dtype=float).T.T, cache=cache), "simple")
+    assert cache.stats()['hits'] == 2, cache.stats()
+    a[0, 0] = 2
+    assert matrix2latex(a, cache=cache) == matrix2latex(a) # content changed, a miss
+    assert matrix2latex(a.T, cache=cache) == matrix2latex(a.T)
+    assert matrix2latex(a[:, ::2], cache=cache) == matrix2latex(a[:, ::2])
+    assert cache.stats()['hits'] == 2, cache.stats()
+
+def test_diskcache():
+    import shutil
+    from matrix2latex.render import matrix2image
+    shutil.rmtree('tmp_diskcache', ignore_errors=True)
+    cache = DiskCache('tmp_diskcache')
+    t = matrix2latex(m, cache=cache)
+    assertEqual(t, "simple")
+    assertEqual(matrix2latex(m, cache=DiskCache('tmp_diskcache')), "simple") # another process
+    assert cache.stats() == dict(hits=0, misses=1, entries=1, bytes=len(t)), cache.stats()
+
+    # a fake tex compiler, writes a '.pdf' and counts its calls
+    tex = [sys.executable, '-c', "import sys; open(sys.argv[1][:-4] + '.pdf', 'w').write(open(sys.argv[1]).read()); "
+                                 "open('%s', 'a').write('x')" % os.path.abspath('tmp_diskcache_calls')]
+    for i in range(2):
+        wd, latex = matrix2image(m, 'tmp_diskcache', cache=cache, tex=tex[0], tex_options=tex[1:])
+        assert wd is None
+        f = open('tmp_diskcache.pdf')
+        assert f.read() == latex
+        f.close()
+    f = open('tmp_diskcache_calls')
+    assert f.read() == 'x'          # compiled once
+    f.close()
+    assert cache.stats()['hits'] == 3, cache.stats() # the table twice, the image once
+
+    cache = DiskCache('tmp_diskcache', maxBytes=len(latex) + 10)
+    matrix2latex(m, cache=cache, caption='evicts')
+    assert cache.stats()['entries'] == 1 and cache.stats()['bytes'] <= len(latex) + 10, cache.stats()
+    cache.clear()
+    assert cache.stats()['entries'] == 0
+    for name in ('tmp_diskcache.pdf', 'tmp_diskcache_calls'):
+        os.remove(name)
+    shutil.rmtree('tmp_diskcache')
+
+def test_module_names():
+    # modules of the user named like the ones of the package must not be picked up by matrix2latex
+    import shutil
+    import subprocess
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    shutil.rmtree('tmp_modules', ignore_errors=True)
+    os.mkdir('tmp_modules')
+    names = ('cache', 'diskcache', 'files', 'parallel', 'formatting', 'vectorize', 'profiling', 'metrics')
+    for name in names:
+        f = open(os.path.join('tmp_modules', name + '.py'), 'w')
+        f.write('# not part of matrix2latex\n')
+        f.close()
+    p = subprocess.Popen([sys.executable, '-c', 'import sys; import %s; sys.path.append(%r); '
+                          'from matrix2latex import matrix2latex; print(matrix2latex([[1, 2]], format="%%d"))'
+                          % (', '.join(names), root)],
+                         cwd='tmp_modules', stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = p.communicate()
+    shutil.rmtree('tmp_modules')
+    assert p.returncode == 0, err.decode()
+    assert out.decode()[:-1] == matrix2latex([[1, 2]], format='%d')
+
+def test_matrix2image_cache():
+    import shutil
+    import pickle
+    import copy
+    from matrix2latex.render import matrix2image
+    shutil.rmtree('tmp_imagecache', ignore_errors=True)
+    # a fake tex compiler, writes a '.pdf' and counts its calls
+    tex = [sys.executable, '-c', "import sys; open(sys.argv[-1][:-4] + '.pdf', 'w').write('pdf'); "
+                                 "open('%s', 'a').write('x')" % os.path.abspath('tmp_imagecache_calls')]
+    for cache in ('tmp_imagecache', RenderCache()):
+        result = matrix2image(m, 'tmp_imagecache', cache=cache, tex=tex[0], tex_options=tex[1:])
+        assert not result.cached and result.working_dir is None
+        result = matrix2image(m, 'tmp_imagecache.pdf', cache=cache, tex=tex[0], tex_options=tex[1:])
+        assert result.cached and result.latex == result[1]
+        wd, latex = result
+        for other in (pickle.loads(pickle.dumps(result)), copy.copy(result)):
+            assert other == result and other.cached and type(other) is type(result)
+        result = matrix2image(m, 'tmp_imagecache', cache=cache, tex=tex[0], tex_options=tex[1:] + ['-draft'])
+        assert not result.cached    # other tex_options
+    f = open('tmp_imagecache_calls')
+    assert f.read() == 'xxxx'
+    f.close()
+    for name in ('tmp_imagecache.pdf', 'tmp_imagecache_calls'):
+        os.remove(name)
+    shutil.rmtree('tmp_imagecache')
+
+def test_matrix2images():
+    import shutil
+    from matrix2latex.render import matrix2images
+    # fake tex and pdfseparate, the pdf is the document and each page a table
+    def script(name, code):
+        f = open(name, 'w')
+        f.write('#!%s\nimport sys\n%s\n' % (sys.executable, code))
+        f.close()
+        os.chmod(name, 0o755)
+        return os.path.abspath(name)
+    tex = script('tmp_tex', "open(sys.argv[-1][:-4] + '.pdf', 'w').write(open(sys.argv[-1]).read())")
+    pdfseparate = script('tmp_pdfseparate', "pages = open(sys.argv[1]).read().split(r'\\begin{standalone}')[1:]\n"
+                         "for i, page in enumerate(pages): open(sys.argv[2] % (i + 1), 'w').write(page)")
+    jobs = [(m, 'tmp_images1'), ([[1]], 'tmp_images2.pdf', dict(caption='two'))]
+    wd, latex = matrix2images(jobs, tex=tex, pdfseparate=pdfseparate, format='%g')
+    assert wd is None
+    for name, table in (('tmp_images1.pdf', matrix2latex(m, format='%g')),
+                        ('tmp_images2.pdf', matrix2latex([[1]], caption='two', format='%g'))):
+        f = open(name)
+        assert table in f.read()
+        f.close()
+        os.remove(name)
+    profile = Profile()
+    matrix2images(jobs, tex=tex, pdfseparate=pdfseparate, cache='tmp_images_cache', profile=profile)
+    matrix2images(jobs, tex=tex, pdfseparate=pdfseparate, cache='tmp_images_cache', profile=profile)
+    assert DiskCache('tmp_images_cache').stats()['entries'] == 2 # the tables
+    assert profile.tables == 2 and set(['template', 'compile', 'copy', 'cleanup']) <= set(profile.phases)
+    try:
+        matrix2images(jobs, tex=tex, pdfseparate=pdfseparate, in_memory=True)
+        assert False, 'expected ValueError'
+    except ValueError:
+        pass
+    try:
+        matrix2images(jobs, tex=tex, pdfseparate=script('tmp_pdfseparate', ''))
+        assert False, 'expected IOError'
+    except IOError:
+        pass
+    for name in ('tmp_tex', 'tmp_pdfseparate', 'tmp_images1.pdf', 'tmp_images2.pdf'):
+        os.remove(name)
+    shutil.rmtree('tmp_images_cache')
+
+def test_format_dir():
+    import shutil
+    from matrix2latex.render import matrix2image
+    shutil.rmtree('tmp_formats', ignore_errors=True)
+    # a fake tex, dumps a format with -ini (failing if dumping is 'unsupported', a format
+    # failing to load if it is 'broken') and logs its calls
+    log = os.path.abspath('tmp_tex_log')
+    f = open('tmp_tex', 'w')
+    f.write('#!%s\nimport sys\nopen(%r, "a").write(" ".join(sys.argv[1:2]) + "\\n")\n'
+            'if sys.argv[1] == "-ini":\n'
+            '    if "unsupported" in open("preamble.tex").read(): sys.exit(1)\n'
+            '    open(sys.argv[3][len("-jobname="):] + ".fmt", "w").write(open("preamble.tex").read())\n'
+            'elif sys.argv[1].startswith("-fmt=") and "broken" in open(sys.argv[1][5:] + ".fmt").read():\n'
+            '    sys.exit(1)\n'
+            'else:\n'
+            '    open(sys.argv[-1][:-4] + ".pdf", "w").write("pdf")\n' % (sys.executable, log))
+    f.close()
+    os.chmod('tmp_tex', 0o755)
+    tex = os.path.abspath('tmp_tex')
+    metrics.registry.reset()
+    for preamble in ('', '% unsupported', '% broken'):
+        for i in range(2):
+            matrix2image(m, 'tmp_format', tex=tex, format_dir='tmp_formats', latex_preamble=preamble)
+    values = metrics.registry.toDict() # the failed -fmt call is not a failed or timed compile
+    assert values['matrix2image_compile_failures_total'] == 0, values
+    assert values['matrix2image_format_fallbacks_total'] == 1, values
+    assert values['matrix2image_compile_seconds']['count'] == 6, values
+    f = open(log)
+    calls = f.read().split('\n')
+    f.close()
+    assert calls[0] == '-ini' and calls[1].startswith('-fmt=') and calls[2].startswith('-fmt='), calls
+    assert calls[3:6] == ['-ini', '-interaction=nonstopmode', '-interaction=nonstopmode'], calls
+    assert calls[6] == '-ini' and calls[7].startswith('-fmt=') and calls[8:] == ['-interaction=nonstopmode']*2 + [''], calls
+    assert len([name for name in os.listdir('tmp_formats') if name.endswith('.fmt')]) == 1
+    for name in ('tmp_tex', 'tmp_tex_log', 'tmp_format.pdf'):
+        os.remove(name)
+    shutil.rmtree('tmp_formats')
+
+def test_in_memory():
+    from matrix2latex.render import matrix2image
+    # a fake tex, writes a '.pdf', a '.png' and a '.log'
+    code = ("import sys, os; name = sys.argv[-1][:-4]; assert os.getcwd().startswith('/dev/shm') == os.path.isdir('/dev/shm'); "
+            "[open(name + e, 'w').write(e) for e in ('.pdf', '.png', '.log')]")
+    cache = RenderCache()
+    for i in range(2):
+        result = matrix2image(m, 'tmp_in_memory', tex=sys.executable, tex_options=['-c', code],
+                              in_memory=True, cache=cache, output_format='.png')
+        wd, latex = result
+        assert wd is None and result.cached == (i == 1)
+        assert result.png == b'.png'
+        assert (result.pdf, result.log) == ((None, None) if result.cached else (b'.pdf', b'.log'))
+    assert not os.path.exists('tmp_in_memory.png')
+
+def test_profile():
+    from matrix2latex.render import matrix2image
+    profile = Profile()
+    matr = [[1e-10, 2, 3], [4, 5, 6]]
+    t = matrix2latex(matr, 'tmp_profile', profile=profile, format='%g')
+    assert t == matrix2latex(matr, format='%g', label='tmp_profile')
+    stats = profile.stats()
+    assert set(stats['phases']) == set(['keywords', 'convert', 'dimensions', 'plan', 'format', 'fix', 'write']), stats
+    assert stats['phases']['fix']['calls'] == 1 and stats['phases']['keywords']['calls'] == 1
+    assert (stats['tables'], stats['rows'], stats['cells'], stats['bytes']) == (1, 2, 6, len(t)), stats
+    assert 'tmp_profile' not in str(profile) and 'fix' in str(profile)
+    os.remove('tmp_profile.tex')
+
+    matrix2latex(matr, profile=profile, cache=RenderCache(), workers=2, chunkSize=1)
+    assert profile.stats()['phases']['cache']['calls'] == 2 and profile.stats()['rows'] == 4
+    matrix2image(matr, 'tmp_profile', profile=profile, tex=None)
+    assert set(['template', 'compile', 'cleanup']) <= set(profile.phases) and profile.tables == 3
+
+def test_metrics():
+    from matrix2latex.render import matrix2image
+    import importlib
+    assert importlib.import_module('matrix2latex.metrics') is metrics # one registry
+    metrics.registry.reset()
+    t = matrix2latex(m)
+    matrix2latex(iter(m), columns=4)
+    matrix2latex(m, 'tmp_metrics', shardRows=1)
+    cache = RenderCache()
+    matrix2latex(m, cache=cache)
+    matrix2latex(m, cache=cache)
+    assert ''.join(iter_latex(iter(m))) == t
+    values = metrics.registry.toDict()
+    assert values['matrix2latex_tables_total'] == 5, values
+    assert values['matrix2latex_cells_total'] == 6 + 8 + 6 + 6 + 6, values
+    assert values['matrix2latex_emitted_characters_total'] > 4*len(t), values
+    assert (values['matrix2latex_cache_hits_total'], values['matrix2latex_cache_misses_total']) == (1, 1), values
+    for name in ('tmp_metrics.tex', 'tmp_metrics-001.tex', 'tmp_metrics-002.tex'):
+        os.remove(name)
+
+    metrics.registry.reset()
+    render_many([(m, None)]*4, workers=2) # counted in the worker processes
+    values = metrics.registry.toDict()
+    assert values['matrix2latex_tables_total'] == 4, values
+    assert values['matrix2latex_emitted_characters_total'] == 4*len(t), values
+    metrics.registry.reset()
+    matrix2latex(m)
+
+    try:
+        matrix2image(m, 'tmp_metrics', tex=sys.executable, tex_options=['-c', 'import sys; sys.exit(1)'])
+    except Exception:
+        pass
+    matrix2image(m, 'tmp_metrics', tex=sys.executable, tex_options=['-c', "open('tmp_metrics.pdf', 'w')"])
+    os.remove('tmp_metrics.pdf')
+    values = metrics.registry.toDict()
+    assert values['matrix2image_compile_failures_total'] == 1, values
+    assert values['matrix2image_compile_seconds']['count'] == 2, values
+    assert list(values['matrix2image_compile_seconds']['buckets'].values())[-1] == 2, values
+
+    text = metrics.registry.toPrometheus()
+    assert '# TYPE matrix2latex_tables_total counter\nmatrix2latex_tables_total 3\n' in text, text # 1 and 2 images
+    assert 'matrix2image_compile_seconds_bucket{le="+Inf"} 2\nmatrix2image_compile_seconds_sum ' in text, text
+    assert 'matrix2image_compile_seconds_count 2\n' in text, text
+    for line in text.splitlines(): # name value, or a comment
+        assert line.startswith('# ') or len(line.split(' ')) == 2, line
+
+def test_benchmark():
+    import io
+    sys.path.insert(0, '../benchmark')
+    try:
+        import bench
+    finally:
+        del sys.path[0]
+    if bench.tracemalloc is None: # python 2, pypy
+        return
+    out = io.StringIO() if sys.version_info[0] >= 3 else io.BytesIO()
+    results = bench.run('list_format', maxCells=10, out=out)
+    assert sorted(results) == ['list_format/10', 'list_formatColumn/10'], results
+    assert out.getvalue().count('\n') == 2
+    baseline = dict((key, dict(seconds=0.01, peak=10**6)) for key in results)
+    assert bench.compare(baseline, baseline, 0.25) == []
+    slower = dict((key, dict(seconds=0.02, peak=10**6)) for key in results)
+    assert len(bench.compare(slower, baseline, 0.25)) == 2
+    assert bench.compare(slower, baseline, 1.5) == []
+    bigger = dict((key, dict(seconds=0.01, peak=2*10**6)) for key in results)
+    assert len(bench.compare(bigger, baseline, 0.25)) == 2
+    assert bench.main(['-k', 'list_format', '--max-cells', '10', '--baseline', 'tmp_missing.json']) == 2
+
+def test_ifChanged():
+    def read(name):
+        f = open(name)
+        content = f.read()
+        f.close()
+        return content
+    updated = list()
+    t = matrix2latex(m, 'tmp_ifChanged', ifChanged=True, updated=updated)
+    assert updated == ['tmp_ifChanged.tex'] and read('tmp_ifChanged.tex') == t
+    os.utime('tmp_ifChanged.tex', (0, 0))
+    updated = list()
+    assert matrix2latex(m, 'tmp_ifChanged', ifChanged=True, updated=updated) == t
+    assert updated == [] and os.path.getmtime('tmp_ifChanged.tex') == 0 # not touched
+    matrix2latex(m, 'tmp_ifChanged', ifChanged=True, updated=updated, caption='changed')
+    assert updated == ['tmp_ifChanged.tex'] and read('tmp_ifChanged.tex') != t
+
+    # a failed render leaves the file as it was
+    t = read('tmp_ifChanged.tex')
+    try:
+        matrix2latex(iter([[1, 2], [1, 2, 3]]), 'tmp_ifChanged', ifChanged=True)
+    except ValueError:
+        pass
+    assert read('tmp_ifChanged.tex') == t
+    assert [name for name in os.listdir('.') if name.endswith('.tmp')] == []
+
+    updated = list()
+    matrix2latex(m, 'tmp_ifChanged', ifChanged=True, updated=updated, shardRows=1)
+    assert sorted(updated) == ['tmp_ifChanged-001.tex', 'tmp_ifChanged-002.tex', 'tmp_ifChanged.tex']
+    updated = list()
+    matrix2latex(m, 'tmp_ifChanged', ifChanged=True, updated=updated, shardRows=1)
+    assert updated == []
+    cache = RenderCache()
+    matrix2latex(m, 'tmp_ifChanged', cache=cache)
+    matrix2latex(m, 'tmp_ifChanged', ifChanged=True, updated=updated, cache=cache) # a hit
+    assert updated == [] and cache.stats()['hits'] == 1
+    for name in ('tmp_ifChanged.tex', 'tmp_ifChanged-001.tex', 'tmp_ifChanged-002.tex'):
+        os.remove(name)
+
+def test_stream():
+    def read(name):
+        f = open(name)
+        content = f.read()
+        f.close()
+        return content
+    t = matrix2latex(m, None, label='tmp_stream')
+    metrics.registry.reset()
+    updated = list()
+    assert matrix2latex(iter(m), 'tmp_stream', stream=True, updated=updated) is None
+    assert read('tmp_stream.tex') == t and updated == ['tmp_stream.tex']
+    assert metrics.registry.toDict()['matrix2latex_emitted_characters_total'] == len(t)
+    profile = Profile()
+    assert Renderer(stream=True, profile=profile).render(m, 'tmp_stream') is None
+    assert read('tmp_stream.tex') == t and profile.tables == 1
+    assert matrix2latex(m, stream=True) == matrix2latex(m) # no file to stream to
+    cache = RenderCache()
+    assert matrix2latex(m, 'tmp_stream', stream=True, cache=cache) is None
+    assert cache.stats()['entries'] == 0
+
+    # a failed render leaves the file as it was
+    try:
+        matrix2latex(iter([[1, 2], [1, 2, 3]]), 'tmp_stream', stream=True)
+    except ValueError:
+        pass
+    assert read('tmp_stream.tex') == t
+    assert [name for name in os.listdir('.') if name.endswith('.tmp')] == []
+    os.remove('tmp_stream.tex')
+
+def test_linear_scaling():
+    """Render time per cell should stay (roughly) constant from 10^3 to 10^6 cells"""
+    import time
+    perCell = list()
+    for size in (10**3, 10**4, 10**5, 10**6):
+        matr = [[0.5*i + j for j in range(10)] for i in range(size//10)]
+        best = None
+        for repeat in range(max(1, 10**4//size)):
+            start = time.time()
+            matrix2latex(matr)
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        perCell.append(best/size)
+    # a quadratic buffer gives a factor of ~100 between 10^4 and 10^6 cells
+    assert perCell[-1] < 5*min(perCell[1:]), perCell
+
+def test_pandas_dtypes():
+    # DataFrames are formatted column-wise, compare with the nested list equivalent
+    try:
+        import pandas as pd
+        import numpy as np
+    except ImportError:
+        return
+    df = pd.DataFrame({'f': [1.5, np.nan, np.inf, 1e-20], 'i': [1, 2, 3, 4], 'b': [True, False, True, True],
+                       'o': ['a', '1', None, 'x'], 'c': pd.Categorical(['a', 'b', 'a', None]),
+                       'mix': [1, 'b', 2.5, np.nan]}, index=['w', 'x', 'y', 'z'])
+    records = df.to_records(index=False).tolist()
+    for k in (dict(), dict(format='%s'), dict(format='$%.2f$'),
+              dict(formatColumn=['%s', '%d', '%g', '%s', '%g', '%g']), dict(transpose=True)):
+        t = matrix2latex(df, **k)
+        if 'transpose' not in k:
+            k['headerColumn'] = list(df.index)
+            k['headerRow'] = list(df.columns)
+        assert t == matrix2latex(records, **k), (k, t)
+
+    # dates as strings, missing values as {-}
+    df = pd.DataFrame({'d': pd.to_datetime(['2020-01-01 00:00', None]),
+                       's': pd.array(['x', None], dtype='string')})
+    t = matrix2latex(df, headerColumn=None, headerRow=None, environments=None)
+    assert t.split('\n') == [r'2020-01-01 & x\\', r'{-} & {-}\\', ''], t
+
 # Pandas Panel now depricated, remove test
 # def test_pandas_Panel():
 #     try:
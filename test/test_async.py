@@ -0,0 +1,69 @@
+"""This file is a hack: async def is a syntax error before python 3.5, so these tests are placed here,
+see test_syntaxError.py."""
+import os
+import sys
+import asyncio
+import subprocess
+
+from matrix2latex import matrix2latex
+
+def test_matrix2image_async():
+    from matrix2latex.asyncrender import matrix2image_async
+    # a fake tex, writes a '.pdf' after sleeping for the number of seconds in the name of the document
+    f = open('tmp_async_tex', 'w')
+    # and logs its start and end
+    f.write('#!%s\nimport sys, time\nname = sys.argv[-1][:-4]\nlog = %r\n'
+            'open(log, "a").write("start %%s\\n" %% name)\n'
+            'time.sleep(float(name.split("_")[-1]))\n'
+            'open(log, "a").write("end %%s\\n" %% name)\n'
+            'open(name + ".pdf", "w").write(open(sys.argv[-1]).read())\n' % (sys.executable, os.path.abspath('tmp_async_log')))
+    f.close()
+    os.chmod('tmp_async_tex', 0o755)
+    tex = os.path.abspath('tmp_async_tex')
+    if os.path.exists('tmp_async_log'):
+        os.remove('tmp_async_log')
+
+    async def main():
+        semaphore = asyncio.Semaphore(4)
+        results = await asyncio.gather(*[matrix2image_async([[i]], 'tmp_async%d_0.2' % i, tex=tex, semaphore=semaphore)
+                                         for i in range(4)])
+        log = open('tmp_async_log').read().split()[::2]
+        assert log == ['start']*4 + ['end']*4, log # at the same time
+        for i, (wd, latex) in enumerate(results):
+            assert wd is None
+            f = open('tmp_async%d_0.2.pdf' % i)
+            assert f.read() == latex and matrix2latex([[i]]) in latex
+            f.close()
+            os.remove('tmp_async%d_0.2.pdf' % i)
+        result = await matrix2image_async([[1]], 'tmp_async_0', tex=tex, in_memory=True)
+        assert result.pdf.decode() == result.latex and not os.path.exists('tmp_async_0.pdf')
+        try:
+            await matrix2image_async([[1]], 'tmp_async_10', tex=tex, timeout=0.2)
+            assert False, 'expected TimeoutExpired'
+        except subprocess.TimeoutExpired:
+            pass
+        try:
+            await matrix2image_async([[1]], 'tmp_async_0', tex=sys.executable, tex_options=['-c', 'import sys; sys.exit(1)'])
+            assert False, 'expected CalledProcessError'
+        except subprocess.CalledProcessError:
+            pass
+
+        task = asyncio.ensure_future(matrix2image_async([[1]], 'tmp_async_cancel_0.5', tex=tex))
+        while not os.path.exists('tmp_async_log') or 'start tmp_async_cancel' not in open('tmp_async_log').read():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        try:
+            await task
+            assert False, 'expected CancelledError'
+        except asyncio.CancelledError:
+            pass
+        await asyncio.sleep(0.7)
+        assert 'end tmp_async_cancel' not in open('tmp_async_log').read() # killed
+
+    loop = asyncio.new_event_loop() # asyncio.run is python >= 3.7
+    try:
+        loop.run_until_complete(main())
+    finally:
+        loop.close()
+    os.remove('tmp_async_tex')
+    os.remove('tmp_async_log')